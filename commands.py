@@ -8,96 +8,55 @@ GitHub: https://github.com/theamanchaudhary
 from telethon import TelegramClient, Button
 from config import ConfigManager, BotConfig
 from database import Database
+from state import State
+from rate_limiter import Cooldown
 from datetime import datetime
-import sys
+from functools import lru_cache
 
-class BotCommands:
-    """Handles bot commands"""
-    
-    def __init__(self, client: TelegramClient, config: BotConfig, config_manager: ConfigManager, db: Database, bot_instance):
-        self.client = client
-        self.config = config
-        self.config_manager = config_manager
-        self.db = db
-        self.bot = bot_instance
-    
-    async def handle_command(self, command: str, args: list, event):
-        """Route command to appropriate handler"""
-        user_id = event.sender_id
-        
-        # Public commands (available to all users)
-        public_commands = {
-            'start': self.cmd_start,
-            'help': self.cmd_help,
-        }
-        
-        # Owner only commands
-        owner_commands = {
-            'status': self.cmd_status,
-            'addsource': self.cmd_addsource,
-            'setdest': self.cmd_setdest,
-            'remove': self.cmd_remove,
-            'list': self.cmd_list,
-            'mode': self.cmd_mode,
-            'broadcast': self.cmd_broadcast,
-            'ban': self.cmd_ban,
-            'unban': self.cmd_unban,
-            'banned': self.cmd_banned,
-            'stats': self.cmd_stats,
-            'users': self.cmd_users,
-            'stop': self.cmd_stop,
-        }
-        
-        # Check if command exists
-        if command in public_commands:
-            await public_commands[command](args, event)
-        elif command in owner_commands:
-            if user_id == self.bot.owner_id:
-                await owner_commands[command](args, event)
-            else:
-                await event.reply("❌ This command is only for bot owner!")
-        else:
-            await event.reply(f"❌ Unknown command: /{command}\n\nType /help for available commands")
-    
-    async def cmd_start(self, args, event):
-        """Welcome message"""
-        user_id = event.sender_id
-        is_owner = user_id == self.bot.owner_id
-        
-        if is_owner:
-            buttons = [
-                [Button.inline("📊 Stats", b"stats"), Button.inline("📋 Channels", b"list")],
-                [Button.inline("👥 Users", b"users"), Button.inline("🚫 Banned", b"banned")],
-                [Button.inline("📡 Broadcast", b"broadcast"), Button.inline("❓ Help", b"help")]
-            ]
-        else:
-            buttons = [
-                [Button.inline("❓ Help", b"help"), Button.inline("📞 Support", b"support")]
-            ]
-        
-        welcome_text = f"""
+@lru_cache(maxsize=128)
+def _btn(label: str, data: bytes):
+    """Shared inline button for a (label, data) pair"""
+    return Button.inline(label, data)
+
+# Users shown per page of /users
+USERS_PAGE_SIZE = 20
+
+_OWNER_WELCOME_TEXT = """
 👋 **Welcome to Auto Forward Bot!**
 
-{"🔐 **Owner Panel**" if is_owner else "ℹ️ **User Mode**"}
+🔐 **Owner Panel**
 
 This bot automatically forwards messages from source channels to your destination channel.
 
-{"✨ **Quick Actions:**\n• /addsource - Add source channel\n• /setdest - Set destination\n• /stats - View statistics\n• /broadcast - Send message to all users" if is_owner else "💡 For bot setup, contact the owner."}
+✨ **Quick Actions:**
+• /addsource - Add source channel
+• /setdest - Set destination
+• /stats - View statistics
+• /broadcast - Send message to all users
 
-{"" if is_owner else "🤖 **Bot Features:**\n• Auto forward messages\n• Copy or Forward mode\n• Multi-channel support"}
+✨ **Created by:** @akmovieverse
+🔗 **Hub:** @instawallpaper
+"""
+
+_USER_WELCOME_TEXT = """
+👋 **Welcome to Auto Forward Bot!**
+
+ℹ️ **User Mode**
+
+This bot automatically forwards messages from source channels to your destination channel.
+
+💡 For bot setup, contact the owner.
+
+🤖 **Bot Features:**
+• Auto forward messages
+• Copy or Forward mode
+• Multi-channel support
 
 ✨ **Created by:** @akmovieverse
 🔗 **Hub:** @instawallpaper
 """
-        await event.reply(welcome_text, buttons=buttons)
-    
-    async def cmd_help(self, args, event):
-        """Show help message"""
-        user_id = event.sender_id
-        is_owner = user_id == self.bot.owner_id
-        
-        if is_owner:
-            help_text = """
+
+_OWNER_HELP_TEXT = """
 🤖 **Bot Commands - Owner Panel**
 
 📥 **Channel Management:**
@@ -131,8 +90,8 @@ This bot automatically forwards messages from source channels to your destinatio
 ✨ Created by @akmovieverse
 🔗 Hub: @instawallpaper
 """
-        else:
-            help_text = """
+
+_USER_HELP_TEXT = """
 🤖 **Bot Information**
 
 This is an auto-forward bot that helps channel owners automatically forward messages.
@@ -149,30 +108,114 @@ Contact the bot owner for setup and support.
 ✨ Created by @AkMovieVerse
 🔗 GK: https://t.me/instawallpaper
 """
+
+_OWNER_BUTTONS = [
+    [_btn("📊 Stats", b"stats"), _btn("📋 Channels", b"list")],
+    [_btn("👥 Users", b"users"), _btn("🚫 Banned", b"banned")],
+    [_btn("📡 Broadcast", b"broadcast"), _btn("❓ Help", b"help")]
+]
+
+_USER_BUTTONS = [
+    [_btn("❓ Help", b"help"), _btn("📞 Support", b"support")]
+]
+
+_BACK_BUTTONS = [[_btn("« Back", b"start")]]
+_CANCEL_BUTTONS = [[_btn("« Cancel", b"start")]]
+
+class BotCommands:
+    """Handles bot commands"""
+    
+    __slots__ = ('client', 'config', 'config_manager', 'db', 'bot', '_owner_id', '_public', '_owner', '_cb_handlers', '_cooldown')
+    
+    def __init__(self, client: TelegramClient, config: BotConfig, config_manager: ConfigManager, db: Database, bot_instance):
+        self.client = client
+        self.config = config
+        self.config_manager = config_manager
+        self.db = db
+        self.bot = bot_instance
+        self._owner_id = config.owner_id
+        
+        # Public commands (available to all users)
+        self._public = {
+            'start': self.cmd_start,
+            'help': self.cmd_help,
+        }
         
-        await event.reply(help_text)
+        # Owner only commands
+        self._owner = {
+            'status': self.cmd_status,
+            'addsource': self.cmd_addsource,
+            'setdest': self.cmd_setdest,
+            'remove': self.cmd_remove,
+            'list': self.cmd_list,
+            'mode': self.cmd_mode,
+            'broadcast': self.cmd_broadcast,
+            'ban': self.cmd_ban,
+            'unban': self.cmd_unban,
+            'banned': self.cmd_banned,
+            'stats': self.cmd_stats,
+            'users': self.cmd_users,
+            'stop': self.cmd_stop,
+        }
+        
+        # Owner panel button callbacks
+        self._cb_handlers = {
+            'stats': self._cb_stats,
+            'list': self._cb_list,
+            'users': self._cb_users,
+            'banned': self._cb_banned,
+            'broadcast': self._cb_broadcast,
+            'help': self._cb_help,
+            'support': self._cb_support,
+            'start': self._cb_start,
+        }
+        
+        self._cooldown = Cooldown(0.5)
+    
+    async def handle_command(self, command: str, args: list, event):
+        """Route command to appropriate handler"""
+        handler = self._public.get(command)
+        if handler:
+            await handler(args, event)
+            return
+        
+        handler = self._owner.get(command)
+        if handler:
+            if event.sender_id == self._owner_id:
+                await handler(args, event)
+            else:
+                await event.reply("❌ This command is only for bot owner!")
+        else:
+            await event.reply(f"❌ Unknown command: /{command}\n\nType /help for available commands")
+    
+    async def cmd_start(self, args, event):
+        """Welcome message"""
+        if event.sender_id == self._owner_id:
+            await event.reply(_OWNER_WELCOME_TEXT, buttons=_OWNER_BUTTONS)
+        else:
+            await event.reply(_USER_WELCOME_TEXT, buttons=_USER_BUTTONS)
+    
+    async def cmd_help(self, args, event):
+        """Show help message"""
+        await event.reply(_OWNER_HELP_TEXT if event.sender_id == self._owner_id else _USER_HELP_TEXT)
     
     async def cmd_status(self, args, event):
         """Show bot status"""
-        channels = await self.db.get_all_channels()
-        destination = await self.db.get_destination()
-        
-        copy_count = sum(1 for ch in channels if ch['forward_mode'] == 'copy')
-        forward_count = len(channels) - copy_count
+        snapshot = await self.db.get_status_snapshot()
         
         status = f"""
 🤖 **Bot Status**
 
 📊 **Configuration:**
-• Source Channels: {len(channels)}
-• Destination: {'✅ Set' if destination else '❌ Not set'}
+• Source Channels: {snapshot['total']}
+• Destination: {'✅ Set' if snapshot['destination_set'] else '❌ Not set'}
 
 📋 **Forward Modes:**
-• Copy Mode: {copy_count} channels
-• Forward Mode: {forward_count} channels
+• Copy Mode: {snapshot['copy']} channels
+• Forward Mode: {snapshot['forward']} channels
 
-👥 **Users:** {await self.db.get_user_count()}
-🚫 **Banned:** {len(await self.db.get_banned_users())}
+👥 **Users:** {snapshot['users']}
+🚫 **Banned:** {snapshot['banned']}
 
 ✨ Created by @akmovieverse
 🔗 Hub: @instawallpaper
@@ -181,8 +224,7 @@ Contact the bot owner for setup and support.
     
     async def cmd_addsource(self, args, event):
         """Prepare to add source channel"""
-        self.bot.awaiting_source_forward[event.sender_id] = True
-        self.bot.awaiting_destination_forward[event.sender_id] = False
+        self.bot.user_state[event.sender_id] = State.AWAIT_SOURCE
         
         await event.reply(
             "📥 **Add Source Channel**\n\n"
@@ -197,8 +239,7 @@ Contact the bot owner for setup and support.
     
     async def cmd_setdest(self, args, event):
         """Prepare to set destination"""
-        self.bot.awaiting_destination_forward[event.sender_id] = True
-        self.bot.awaiting_source_forward[event.sender_id] = False
+        self.bot.user_state[event.sender_id] = State.AWAIT_DEST
         
         await event.reply(
             "📤 **Set Destination Channel**\n\n"
@@ -237,17 +278,19 @@ Contact the bot owner for setup and support.
             await event.reply("📋 **No source channels**\n\nUse /addsource to add")
             return
         
-        message = "📋 **Source Channels:**\n\n"
+        parts = ["📋 **Source Channels:**\n\n"]
         for i, ch in enumerate(channels, 1):
             mode_icon = "📋" if ch['forward_mode'] == 'copy' else "➡️"
-            message += f"**{i}.** {mode_icon} {ch['title']}\n"
-            message += f"   Mode: `{ch['forward_mode']}`\n"
-            message += f"   ID: `{ch['channel_id']}`\n\n"
+            parts.append(
+                f"**{i}.** {mode_icon} {ch['title']}\n"
+                f"   Mode: `{ch['forward_mode']}`\n"
+                f"   ID: `{ch['channel_id']}`\n\n"
+            )
         
-        message += "\n💡 /remove <number> - Remove channel\n"
-        message += "💡 /mode <number> <mode> - Change mode"
+        parts.append("\n💡 /remove <number> - Remove channel\n")
+        parts.append("💡 /mode <number> <mode> - Change mode")
         
-        await event.reply(message)
+        await event.reply("".join(parts))
     
     async def cmd_mode(self, args, event):
         """Change forward mode"""
@@ -281,7 +324,7 @@ Contact the bot owner for setup and support.
     
     async def cmd_broadcast(self, args, event):
         """Prepare for broadcast"""
-        self.bot.awaiting_broadcast[event.sender_id] = True
+        self.bot.user_state[event.sender_id] = State.AWAIT_BROADCAST
         
         await event.reply(
             "📡 **Broadcast Mode**\n\n"
@@ -302,20 +345,24 @@ Contact the bot owner for setup and support.
         
         try:
             user_id = int(args[0])
-            reason = " ".join(args[1:]) if len(args) > 1 else "No reason provided"
+            reason = " ".join(args[1:]) or "No reason provided"
             
-            if user_id == self.bot.owner_id:
+            if user_id == self._owner_id:
                 await event.reply("❌ Cannot ban the owner!")
                 return
             
-            # Get username
-            try:
-                user = await self.client.get_entity(user_id)
-                username = user.username or user.first_name
-            except:
-                username = "Unknown"
+            # Get username, asking Telegram only for users we have never seen
+            user = await self.db.get_user(user_id)
+            username = user.get('username') if user else None
+            if not username:
+                try:
+                    entity = await self.client.get_entity(user_id)
+                    username = entity.username or entity.first_name
+                except:
+                    username = "Unknown"
             
             if await self.db.ban_user(user_id, username, reason):
+                self.bot.banned_ids.add(user_id)
                 await event.reply(
                     f"✅ **User Banned**\n\n"
                     f"👤 User: {username}\n"
@@ -337,6 +384,7 @@ Contact the bot owner for setup and support.
             user_id = int(args[0])
             
             if await self.db.unban_user(user_id):
+                self.bot.banned_ids.discard(user_id)
                 await event.reply(f"✅ User `{user_id}` has been unbanned")
             else:
                 await event.reply("❌ User not found in ban list")
@@ -351,21 +399,24 @@ Contact the bot owner for setup and support.
             await event.reply("📋 **No banned users**")
             return
         
-        message = f"🚫 **Banned Users ({len(banned)}):**\n\n"
+        parts = [f"🚫 **Banned Users ({len(banned)}):**\n\n"]
         for user in banned:
-            message += f"👤 {user['username']}\n"
-            message += f"🆔 `{user['user_id']}`\n"
-            message += f"📝 {user['reason']}\n"
-            message += f"📅 {user['banned_date'].strftime('%Y-%m-%d %H:%M')}\n\n"
+            parts.append(
+                f"👤 {user['username']}\n"
+                f"🆔 `{user['user_id']}`\n"
+                f"📝 {user['reason']}\n"
+                f"📅 {user['banned_date']:%Y-%m-%d %H:%M}\n\n"
+            )
         
-        message += "\n💡 /unban <user_id> to unban"
-        await event.reply(message)
+        parts.append("\n💡 /unban <user_id> to unban")
+        await event.reply("".join(parts))
     
     async def cmd_stats(self, args, event):
         """Show detailed statistics"""
         stats = await self.db.get_stats()
+        start_date = self.bot.start_date or stats['start_date']
         
-        days_active = (datetime.now() - stats['start_date']).days
+        days_active = (datetime.now() - start_date).days
         
         message = f"""
 📊 **Bot Statistics**
@@ -380,7 +431,7 @@ Contact the bot owner for setup and support.
 • Total Forwards: {stats['total_forwards']}
 
 📅 **Activity:**
-• Bot Started: {stats['start_date'].strftime('%Y-%m-%d')}
+• Bot Started: {start_date:%Y-%m-%d}
 • Days Active: {days_active}
 • Avg Forwards/Day: {stats['total_forwards'] // max(days_active, 1)}
 
@@ -391,23 +442,41 @@ Contact the bot owner for setup and support.
     
     async def cmd_users(self, args, event):
         """Show all users"""
-        users = await self.db.get_all_users()
+        message, buttons = await self._users_page(0)
         
-        if not users:
+        if not message:
             await event.reply("📋 **No users yet**")
             return
         
-        # Show first 20 users
-        message = f"👥 **Bot Users ({len(users)}):**\n\n"
-        for i, user in enumerate(users[:20], 1):
-            message += f"{i}. {user['username']}\n"
-            message += f"   ID: `{user['user_id']}`\n"
-            message += f"   Joined: {user['joined_date'].strftime('%Y-%m-%d')}\n\n"
+        await event.reply(message, buttons=buttons)
+    
+    async def _users_page(self, offset: int):
+        """Build one page of the user list with prev/next buttons"""
+        total = await self.db.get_user_count()
+        users = await self.db.get_users_page(offset, USERS_PAGE_SIZE)
         
-        if len(users) > 20:
-            message += f"\n... and {len(users) - 20} more users"
+        if not users:
+            return None, None
+        
+        parts = [f"👥 **Bot Users ({total}):**\n\n"]
+        for i, user in enumerate(users, offset + 1):
+            parts.append(
+                f"{i}. {user['username']}\n"
+                f"   ID: `{user['user_id']}`\n"
+                f"   Joined: {user['joined_date']:%Y-%m-%d}\n\n"
+            )
         
-        await event.reply(message)
+        remaining = total - offset - len(users)
+        if remaining > 0:
+            parts.append(f"\n... and {remaining} more users")
+        
+        nav = []
+        if offset > 0:
+            nav.append(_btn("« Prev", f"users:{max(offset - USERS_PAGE_SIZE, 0)}".encode()))
+        if remaining > 0:
+            nav.append(_btn("Next »", f"users:{offset + USERS_PAGE_SIZE}".encode()))
+        
+        return "".join(parts), [nav] if nav else None
     
     async def cmd_stop(self, args, event):
         """Stop the bot"""
@@ -419,86 +488,104 @@ Contact the bot owner for setup and support.
             "🔗 Hub: @instawallpaper"
         )
         print("\n✓ Bot stopped by command")
-        await self.client.disconnect()
-        sys.exit(0)
+        # ForwardBot.run() is waiting on this and performs the one shutdown()
+        self.bot.shutdown_event.set()
     
     async def handle_callback(self, event):
         """Handle button callbacks"""
         data = event.data.decode('utf-8')
-        user_id = event.sender_id
         
-        if user_id != self.bot.owner_id:
+        if event.sender_id != self._owner_id:
             await event.answer("❌ Only owner can use this!", alert=True)
             return
         
-        if data == "stats":
-            await event.answer("Loading stats...")
-            stats = await self.db.get_stats()
-            await event.edit(
-                f"📊 **Statistics**\n\n"
-                f"👥 Users: {stats['total_users']}\n"
-                f"📢 Channels: {stats['total_channels']}\n"
-                f"📤 Forwards: {stats['total_forwards']}\n"
-                f"🚫 Banned: {stats['banned_users']}",
-                buttons=[[Button.inline("« Back", b"start")]]
-            )
-        
-        elif data == "list":
-            await event.answer("Loading channels...")
-            channels = await self.db.get_all_channels()
-            if channels:
-                msg = "📋 **Channels:**\n\n"
-                for i, ch in enumerate(channels[:10], 1):
-                    mode = "📋" if ch['forward_mode'] == 'copy' else "➡️"
-                    msg += f"{i}. {mode} {ch['title']}\n"
-                if len(channels) > 10:
-                    msg += f"\n... +{len(channels)-10} more"
-            else:
-                msg = "No channels configured"
-            await event.edit(msg, buttons=[[Button.inline("« Back", b"start")]])
-        
-        elif data == "users":
-            await event.answer("Loading users...")
-            count = await self.db.get_user_count()
-            await event.edit(
-                f"👥 **Total Users:** {count}\n\nUse /users for full list",
-                buttons=[[Button.inline("« Back", b"start")]]
-            )
-        
-        elif data == "banned":
-            await event.answer("Loading banned users...")
-            banned = await self.db.get_banned_users()
-            if banned:
-                msg = f"🚫 **Banned ({len(banned)}):**\n\n"
-                for user in banned[:5]:
-                    msg += f"• {user['username']}\n"
-                if len(banned) > 5:
-                    msg += f"\n... +{len(banned)-5} more"
-            else:
-                msg = "No banned users"
-            await event.edit(msg, buttons=[[Button.inline("« Back", b"start")]])
-        
-        elif data == "broadcast":
-            await event.answer("Preparing broadcast...")
-            self.bot.awaiting_broadcast[user_id] = True
-            await event.edit(
-                "📡 **Broadcast Mode**\n\nSend your message now",
-                buttons=[[Button.inline("« Cancel", b"start")]]
-            )
-        
-        elif data == "help":
-            await self.cmd_help([], event)
+        if not self._cooldown.allow(event.sender_id):
+            await event.answer("⏳ Slow down")
+            return
         
-        elif data == "support":
-            await event.edit(
-                "📞 **Support**\n\n"
-                "Contact: @AkMovieVerse\n"
-                "WALLPAPER: https://t.me/instawallpaper",
-                buttons=[[Button.inline("« Back", b"start")]]
-            )
+        # Callback data is "<name>" or "<name>:<argument>"
+        name, _, arg = data.partition(":")
+        handler = self._cb_handlers.get(name)
+        if handler:
+            await handler(event, arg)
+    
+    async def _cb_stats(self, event, arg):
+        await event.answer("Loading stats...")
+        stats = await self.db.get_stats()
+        await event.edit(
+            f"📊 **Statistics**\n\n"
+            f"👥 Users: {stats['total_users']}\n"
+            f"📢 Channels: {stats['total_channels']}\n"
+            f"📤 Forwards: {stats['total_forwards']}\n"
+            f"🚫 Banned: {stats['banned_users']}",
+            buttons=_BACK_BUTTONS
+        )
+    
+    async def _cb_list(self, event, arg):
+        await event.answer("Loading channels...")
+        channels = await self.db.get_all_channels()
+        if channels:
+            parts = ["📋 **Channels:**\n\n"]
+            for i, ch in enumerate(channels[:10], 1):
+                mode = "📋" if ch['forward_mode'] == 'copy' else "➡️"
+                parts.append(f"{i}. {mode} {ch['title']}\n")
+            if len(channels) > 10:
+                parts.append(f"\n... +{len(channels)-10} more")
+            msg = "".join(parts)
+        else:
+            msg = "No channels configured"
+        await event.edit(msg, buttons=_BACK_BUTTONS)
+    
+    async def _cb_users(self, event, arg):
+        # "users:<offset>" pages through the list, plain "users" shows the total
+        if arg:
+            try:
+                offset = max(int(arg), 0)
+            except ValueError:
+                offset = 0
+            message, buttons = await self._users_page(offset)
+            await event.edit(message or "📋 **No users yet**", buttons=buttons)
+            return
         
-        elif data == "start":
-            await self.cmd_start([], event)
-
-
-
+        await event.answer("Loading users...")
+        count = await self.db.get_user_count()
+        await event.edit(
+            f"👥 **Total Users:** {count}\n\nUse /users for full list",
+            buttons=_BACK_BUTTONS
+        )
+    
+    async def _cb_banned(self, event, arg):
+        await event.answer("Loading banned users...")
+        banned = await self.db.get_banned_users()
+        if banned:
+            parts = [f"🚫 **Banned ({len(banned)}):**\n\n"]
+            for user in banned[:5]:
+                parts.append(f"• {user['username']}\n")
+            if len(banned) > 5:
+                parts.append(f"\n... +{len(banned)-5} more")
+            msg = "".join(parts)
+        else:
+            msg = "No banned users"
+        await event.edit(msg, buttons=_BACK_BUTTONS)
+    
+    async def _cb_broadcast(self, event, arg):
+        await event.answer("Preparing broadcast...")
+        self.bot.user_state[event.sender_id] = State.AWAIT_BROADCAST
+        await event.edit(
+            "📡 **Broadcast Mode**\n\nSend your message now",
+            buttons=_CANCEL_BUTTONS
+        )
+    
+    async def _cb_help(self, event, arg):
+        await self.cmd_help([], event)
+    
+    async def _cb_support(self, event, arg):
+        await event.edit(
+            "📞 **Support**\n\n"
+            "Contact: @AkMovieVerse\n"
+            "WALLPAPER: https://t.me/instawallpaper",
+            buttons=_BACK_BUTTONS
+        )
+    
+    async def _cb_start(self, event, arg):
+        await self.cmd_start([], event)
@@ -9,73 +9,111 @@ import json
 import os
 from dataclasses import dataclass, asdict
 
-@dataclass
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_OWNER_ID = 5482682830
+DEFAULT_LOG_CHANNEL = -1002416220645
+
+# (environment variable, config field, type)
+_ENV_MAP = (
+    ('API_ID', 'api_id', int),
+    ('API_HASH', 'api_hash', str),
+    ('BOT_TOKEN', 'bot_token', str),
+    ('MONGO_URI', 'mongo_uri', str),
+    ('MONGO_DB_NAME', 'mongo_db_name', str),
+    ('OWNER_ID', 'owner_id', int),
+    ('LOG_CHANNEL', 'log_channel', int),
+    ('MAX_USER_CLIENTS', 'max_user_clients', int),
+)
+
+def _env_overrides() -> dict:
+    """Collect config fields that are set in the environment"""
+    overrides = {}
+    for env_key, field, cast in _ENV_MAP:
+        value = os.environ.get(env_key)
+        if value:
+            try:
+                overrides[field] = cast(value)
+            except ValueError:
+                raise ValueError(f"{env_key} must be an integer, got {value!r}")
+    return overrides
+
+@dataclass(frozen=True, slots=True)
 class BotConfig:
     """Bot configuration data class"""
     # Telegram API Credentials
-    api_id: int = int(os.getenv('API_ID', ''))
-    api_hash: str = os.getenv('API_HASH', '')
-    bot_token: str = os.getenv('BOT_TOKEN', '')
+    api_id: int = 0
+    api_hash: str = ''
+    bot_token: str = ''
     
     # MongoDB Configuration
-    mongo_uri: str = os.getenv('MONGO_URI', '')
-    mongo_db_name: str = os.getenv('MONGO_DB_NAME', '')
+    mongo_uri: str = ''
+    mongo_db_name: str = ''
     
     # Bot Settings
-    owner_id: int = int(os.getenv('OWNER_ID', '5482682830'))
-    log_channel: int = int(os.getenv('LOG_CHANNEL', '-1002416220645'))
+    owner_id: int = DEFAULT_OWNER_ID
+    log_channel: int = DEFAULT_LOG_CHANNEL
+    
+    # Connected user clients kept at once, least recently used are
+    # disconnected beyond this (0 = unlimited). An evicted user's sources
+    # stop forwarding until their next command reconnects the client
+    max_user_clients: int = 0
+    
+    @classmethod
+    def from_env(cls) -> 'BotConfig':
+        """Build configuration from environment variables"""
+        return cls(**_env_overrides())
 
 class ConfigManager:
     """Manages bot configuration"""
     
     def __init__(self, config_file='config.json'):
         self.config_file = config_file
-        self.config = BotConfig()
+        self.config = None
     
     def load_config(self) -> BotConfig:
-        """Load configuration from file or environment variables"""
+        """Load configuration once from file or environment variables"""
+        if self.config is not None:
+            return self.config
+        
         # First try to load from environment variables (for Heroku/Docker)
-        if os.getenv('BOT_TOKEN'):
+        if os.environ.get('BOT_TOKEN'):
             print(f"✓ Configuration loaded from environment variables")
-            self.config = BotConfig()
+            self.config = BotConfig.from_env()
             return self.config
         
         # Otherwise load from config file
         if os.path.exists(self.config_file):
             try:
-                with open(self.config_file, 'r') as f:
-                    data = json.load(f)
-                    # Override with environment variables if they exist
-                    if os.getenv('API_ID'):
-                        data['api_id'] = int(os.getenv('API_ID'))
-                    if os.getenv('API_HASH'):
-                        data['api_hash'] = os.getenv('API_HASH')
-                    if os.getenv('BOT_TOKEN'):
-                        data['bot_token'] = os.getenv('BOT_TOKEN')
-                    if os.getenv('MONGO_URI'):
-                        data['mongo_uri'] = os.getenv('MONGO_URI')
-                    if os.getenv('MONGO_DB_NAME'):
-                        data['mongo_db_name'] = os.getenv('MONGO_DB_NAME')
-                    if os.getenv('OWNER_ID'):
-                        data['owner_id'] = int(os.getenv('OWNER_ID'))
-                    if os.getenv('LOG_CHANNEL'):
-                        data['log_channel'] = int(os.getenv('LOG_CHANNEL'))
-                    
-                    self.config = BotConfig(**data)
-                    print(f"✓ Configuration loaded from file")
+                with open(self.config_file, 'rb') as f:
+                    raw = f.read()
+                data = orjson.loads(raw) if orjson else json.loads(raw)
+                
+                # Override with environment variables if they exist
+                data.update(_env_overrides())
+                
+                self.config = BotConfig(**data)
+                print(f"✓ Configuration loaded from file")
             except Exception as e:
                 print(f"⚠ Error loading config: {e}")
-                self.config = BotConfig()
+                self.config = BotConfig.from_env()
         else:
-            self.config = BotConfig()
+            self.config = BotConfig.from_env()
         
         return self.config
     
     def save_config(self):
         """Save configuration to file"""
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(asdict(self.config), f, indent=4)
+            if orjson:
+                with open(self.config_file, 'wb') as f:
+                    f.write(orjson.dumps(asdict(self.config), option=orjson.OPT_INDENT_2))
+            else:
+                with open(self.config_file, 'w') as f:
+                    json.dump(asdict(self.config), f, indent=4)
             print(f"✓ Configuration saved")
         except Exception as e:
             print(f"✗ Error saving config: {e}")
@@ -5,9 +5,17 @@ Created by: @amanbotz
 GitHub: https://github.com/theamanchaudhary
 """
 
+import asyncio
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
+
+# Seconds a cached read stays valid before hitting MongoDB again
+CACHE_TTL = 10
+# Per-user channel/destination reads; every write invalidates them anyway
+USER_CACHE_TTL = 30
 
 class Database:
     def __init__(self):
@@ -21,6 +29,40 @@ class Database:
         self.user_sessions = None  # Store user sessions for multi-user support
         self.user_channels = None  # Store each user's source channels
         self.user_destinations = None  # Store each user's destination channels
+        
+        self._cache = {}  # key -> (expiry, value)
+        self._cache_locks = {}  # key -> [lock, callers waiting on or holding it]
+    
+    async def _cached(self, key: str, fetch, ttl: float = CACHE_TTL):
+        """Return a cached value, fetching it once on miss"""
+        entry = self._cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        
+        slot = self._cache_locks.get(key)
+        if slot is None:
+            slot = self._cache_locks[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                # Another caller may have filled the cache while we waited
+                entry = self._cache.get(key)
+                if entry and entry[0] > time.monotonic():
+                    return entry[1]
+                
+                value = await fetch()
+                self._cache[key] = (time.monotonic() + ttl, value)
+                return value
+        finally:
+            # Dropped with the last caller, so per-user keys don't pile up
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._cache_locks[key]
+    
+    def _invalidate(self, *keys: str):
+        """Drop cached values after a mutation"""
+        for key in keys:
+            self._cache.pop(key, None)
     
     async def connect(self, mongo_uri: str, db_name: str = 'forward_bot') -> bool:
         """Connect to MongoDB"""
@@ -48,18 +90,39 @@ class Database:
                     'start_date': datetime.now()
                 })
             
+            await self._ensure_indexes()
+            
             print("✓ Connected to MongoDB")
             return True
         except Exception as e:
             print(f"✗ MongoDB connection error: {e}")
             return False
     
+    async def _ensure_indexes(self):
+        """Index the user_id lookups done on every message and command"""
+        try:
+            await asyncio.gather(
+                self.users.create_index('user_id', unique=True),
+                self.banned_users.create_index('user_id'),
+                self.user_sessions.create_index('user_id'),
+                self.user_channels.create_index([('user_id', 1), ('channel_id', 1)]),
+                self.user_destinations.create_index('user_id'),
+            )
+        except Exception as e:
+            print(f"⚠ Could not create indexes: {e}")
+    
+    def close(self):
+        """Close the MongoDB connection pool"""
+        if self.client:
+            self.client.close()
+            self.client = None
+    
     # ============ USER MANAGEMENT ============
     
     async def add_user(self, user_id: int, username: str) -> bool:
-        """Add a new user or update existing"""
+        """Add a new user or update existing, returning True if new"""
         try:
-            await self.users.update_one(
+            result = await self.users.update_one(
                 {'user_id': str(user_id)},
                 {
                     '$set': {
@@ -72,11 +135,35 @@ class Database:
                 },
                 upsert=True
             )
+            if result.upserted_id is None:
+                return False
+            self._invalidate('user_count')
             return True
         except Exception as e:
             print(f"Error adding user: {e}")
             return False
     
+    async def touch_users(self, users: Dict[int, str]):
+        """Record activity for many users in one bulk write"""
+        now = datetime.now()
+        requests = [
+            UpdateOne(
+                {'user_id': str(user_id)},
+                {
+                    '$set': {'username': username, 'last_active': now},
+                    '$setOnInsert': {'joined_date': now}
+                },
+                upsert=True
+            )
+            for user_id, username in users.items()
+        ]
+        try:
+            result = await self.users.bulk_write(requests, ordered=False)
+            if result.upserted_count:
+                self._invalidate('user_count')
+        except Exception as e:
+            print(f"Error updating user activity: {e}")
+    
     async def get_all_users(self) -> List[Dict]:
         """Get all users"""
         try:
@@ -85,10 +172,33 @@ class Database:
         except:
             return []
     
+    async def iter_user_ids(self) -> AsyncIterator[int]:
+        """Stream user IDs without loading whole user documents"""
+        try:
+            async for user in self.users.find({}, {'user_id': 1, '_id': 0}):
+                yield int(user['user_id'])
+        except Exception as e:
+            print(f"Error streaming users: {e}")
+    
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        """Get a single user"""
+        try:
+            return await self.users.find_one({'user_id': str(user_id)})
+        except:
+            return None
+    
+    async def get_users_page(self, skip: int = 0, limit: int = 20) -> List[Dict]:
+        """Get one page of users, oldest first"""
+        try:
+            cursor = self.users.find({}).sort('joined_date', 1).skip(skip).limit(limit)
+            return await cursor.to_list(length=limit)
+        except:
+            return []
+    
     async def get_user_count(self) -> int:
         """Get total user count"""
         try:
-            return await self.users.count_documents({})
+            return await self._cached('user_count', lambda: self.users.count_documents({}))
         except:
             return 0
     
@@ -109,6 +219,7 @@ class Database:
                 'reason': reason,
                 'banned_date': datetime.now()
             })
+            self._invalidate('banned', 'stats')
             return True
         except:
             return False
@@ -117,6 +228,7 @@ class Database:
         """Unban a user"""
         try:
             result = await self.banned_users.delete_one({'user_id': str(user_id)})
+            self._invalidate('banned', 'stats')
             return result.deleted_count > 0
         except:
             return False
@@ -124,8 +236,7 @@ class Database:
     async def get_banned_users(self) -> List[Dict]:
         """Get all banned users"""
         try:
-            cursor = self.banned_users.find({})
-            return await cursor.to_list(length=None)
+            return await self._cached('banned', lambda: self.banned_users.find({}).to_list(length=None))
         except:
             return []
     
@@ -152,6 +263,7 @@ class Database:
                 'forward_mode': forward_mode,
                 'added_date': datetime.now()
             })
+            self._invalidate('channels', 'stats')
             return True
         except:
             return False
@@ -160,6 +272,7 @@ class Database:
         """Remove a source channel"""
         try:
             result = await self.channels.delete_one({'channel_id': channel_id})
+            self._invalidate('channels', 'stats')
             return result.deleted_count > 0
         except:
             return False
@@ -167,8 +280,7 @@ class Database:
     async def get_all_channels(self) -> List[Dict]:
         """Get all source channels"""
         try:
-            cursor = self.channels.find({})
-            return await cursor.to_list(length=None)
+            return await self._cached('channels', lambda: self.channels.find({}).to_list(length=None))
         except:
             return []
     
@@ -179,6 +291,7 @@ class Database:
                 {'channel_id': channel_id},
                 {'$set': {'forward_mode': mode}}
             )
+            self._invalidate('channels')
             return True
         except:
             return False
@@ -190,6 +303,18 @@ class Database:
         except:
             return 0
     
+    async def count_channels_by_mode(self) -> Dict[str, int]:
+        """Count source channels per forward mode"""
+        counts = {'copy': 0, 'forward': 0}
+        try:
+            pipeline = [{'$group': {'_id': '$forward_mode', 'count': {'$sum': 1}}}]
+            async for row in self.channels.aggregate(pipeline):
+                mode = 'copy' if row['_id'] == 'copy' else 'forward'
+                counts[mode] += row['count']
+        except:
+            pass
+        return counts
+    
     # ============ DESTINATION MANAGEMENT ============
     
     async def set_destination(self, channel_id: str, title: str) -> bool:
@@ -214,27 +339,71 @@ class Database:
     
     # ============ STATS ============
     
-    async def increment_forwards(self):
+    async def get_status_snapshot(self) -> Dict:
+        """Get channel, destination, user and ban counts in one concurrent batch"""
+        try:
+            modes, destination, users, banned = await asyncio.gather(
+                self.count_channels_by_mode(),
+                self.destination.find_one({}, {'_id': 1}),
+                self.get_user_count(),
+                self.banned_users.count_documents({})
+            )
+            return {
+                'total': modes['copy'] + modes['forward'],
+                'copy': modes['copy'],
+                'forward': modes['forward'],
+                'destination_set': destination is not None,
+                'users': users,
+                'banned': banned
+            }
+        except:
+            return {
+                'total': 0,
+                'copy': 0,
+                'forward': 0,
+                'destination_set': False,
+                'users': 0,
+                'banned': 0
+            }
+    
+    async def increment_forwards(self, count: int = 1):
         """Increment forward count"""
         try:
             await self.stats.update_one(
                 {},
-                {'$inc': {'total_forwards': 1}}
+                {'$inc': {'total_forwards': count}}
             )
+            self._invalidate('stats')
         except:
             pass
     
+    async def get_start_date(self) -> datetime:
+        """Get the date the bot was first started"""
+        try:
+            stats = await self.stats.find_one({}, {'start_date': 1})
+            return stats.get('start_date', datetime.now())
+        except:
+            return datetime.now()
+    
+    async def _fetch_stats(self) -> Dict:
+        stats, total_users, total_channels, banned_users = await asyncio.gather(
+            self.stats.find_one({}),
+            self.get_user_count(),
+            self.get_channel_count(),
+            self.banned_users.count_documents({})
+        )
+        return {
+            'total_forwards': stats.get('total_forwards', 0),
+            'total_users': total_users,
+            'total_channels': total_channels,
+            'banned_users': banned_users,
+            'start_date': stats.get('start_date', datetime.now())
+        }
+    
     async def get_stats(self) -> Dict:
         """Get bot statistics"""
         try:
-            stats = await self.stats.find_one({})
-            return {
-                'total_forwards': stats.get('total_forwards', 0),
-                'total_users': await self.get_user_count(),
-                'total_channels': await self.get_channel_count(),
-                'banned_users': await self.banned_users.count_documents({}),
-                'start_date': stats.get('start_date', datetime.now())
-            }
+            return await self._cached('stats', self._fetch_stats)
         except:
             return {
                 'total_forwards': 0,
@@ -302,6 +471,7 @@ class Database:
                 'forward_mode': forward_mode,
                 'added_date': datetime.now()
             })
+            self._invalidate(f'user_channels:{user_id}')
             return True
         except:
             return False
@@ -313,6 +483,7 @@ class Database:
                 'user_id': str(user_id),
                 'channel_id': channel_id
             })
+            self._invalidate(f'user_channels:{user_id}')
             return result.deleted_count > 0
         except:
             return False
@@ -320,8 +491,11 @@ class Database:
     async def get_user_channels(self, user_id: int) -> List[Dict]:
         """Get all source channels for specific user"""
         try:
-            cursor = self.user_channels.find({'user_id': str(user_id)})
-            return await cursor.to_list(length=None)
+            return await self._cached(
+                f'user_channels:{user_id}',
+                lambda: self.user_channels.find({'user_id': str(user_id)}).to_list(length=None),
+                USER_CACHE_TTL
+            )
         except:
             return []
     
@@ -332,6 +506,7 @@ class Database:
                 {'user_id': str(user_id), 'channel_id': channel_id},
                 {'$set': {'forward_mode': mode}}
             )
+            self._invalidate(f'user_channels:{user_id}')
             return True
         except:
             return False
@@ -355,6 +530,7 @@ class Database:
                 'title': title,
                 'set_date': datetime.now()
             })
+            self._invalidate(f'user_destination:{user_id}')
             return True
         except:
             return False
@@ -362,6 +538,10 @@ class Database:
     async def get_user_destination(self, user_id: int) -> Optional[Dict]:
         """Get destination channel for specific user"""
         try:
-            return await self.user_destinations.find_one({'user_id': str(user_id)})
+            return await self._cached(
+                f'user_destination:{user_id}',
+                lambda: self.user_destinations.find_one({'user_id': str(user_id)}),
+                USER_CACHE_TTL
+            )
         except:
             return None
@@ -1,43 +1,431 @@
 #!/usr/bin/env python3 | user_id
 
+import os
+import re
 import sys
+import time
+import random
+import argparse
+import tempfile
 import asyncio
-from functools import partial
+import logging
+from contextlib import suppress
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache, partial
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from string import Template
 from telethon import TelegramClient, events, Button, functions
 from telethon.sessions import StringSession
-from telethon.errors import SessionPasswordNeededError
+from telethon.errors import SessionPasswordNeededError, FloodWaitError
+from telethon.tl.types import DocumentAttributeVideo
 from config import ConfigManager, BotConfig
 from database import Database
+from media_cache import MediaCache
+from rate_limiter import RateLimiter, Cooldown, AdaptiveLimiter, EditThrottler
+from state import State, PendingLogin, SourceQueue
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger("forwardbot")
+
+@lru_cache(maxsize=128)
+def _btn(label: str, data: bytes):
+    """Shared inline button for a (label, data) pair"""
+    return Button.inline(label, data)
+
+_LOGGED_IN_ROWS = [
+    [_btn("My Channels", b"mychannels"), _btn("My Status", b"mystatus")],
+    [_btn("Add Source", b"addsource"), _btn("Set Destination", b"setdest")]
+]
+_LOGGED_OUT_ROWS = [[_btn("Login", b"login")]]
+_COMMON_ROWS = [[_btn("Help", b"help"), _btn("My Account", b"myaccount")]]
+_ADMIN_ROWS = [[_btn("Admin Panel", b"admin")]]
+
+# /start keyboards keyed by (is_logged_in, is_owner)
+_START_BUTTONS = {
+    (logged_in, owner): (_LOGGED_IN_ROWS if logged_in else _LOGGED_OUT_ROWS) + _COMMON_ROWS + (_ADMIN_ROWS if owner else [])
+    for logged_in in (True, False)
+    for owner in (True, False)
+}
+
+_BACK_BUTTONS = [[_btn("Back", b"start")]]
+
+_WELCOME_TEMPLATE = Template("""
+**Welcome to Auto Forward Bot!**
+
+$login_status
+
+**What I can do:**
+• Forward messages from any channel
+• Copy mode (no forward tag)
+• Forward mode (with attribution)
+• Multiple channel support
+• Personal forwarding for each user
+
+$owner_text
+
+**Get Started:**
+$get_started_text
+
+**Created by:** @AkMovieVerse
+**Hub:** @instawallpaper
+""")
+
+# /start next steps keyed by is_logged_in
+_GET_STARTED_TEXT = {
+    True: "• Configure your channels\n• Start forwarding!",
+    False: "• Click Login button or use /login\n• Connect your Telegram account\n• Start forwarding!",
+}
+
+_HELP_TEXT = """
+**Bot Commands**
+
+**Account:**
+/login - Login to your Telegram account
+/logout - Logout from bot
+/myaccount - View account info
+
+**Channel Management:**
+/addsource - Add source channel (public/private)
+/setdest - Set destination channel (public/private)
+/list - Show your channels
+/remove <number> - Remove channel
+/cleanup - Leave non-source/destination channels
+/mode <number> <copy|forward> - Change mode
+
+**Information:**
+/status - Your bot status & queue info
+/help - Show this message
+
+**Forward Modes:**
+• **copy** - New message (no forward tag)
+• **forward** - With attribution
+
+**Sequential Processing:**
+• Messages from each source are processed in order
+• Different sources are forwarded in parallel
+• No media skipped, even with bulk posts
+• Prevents server overload
+• Automatic queue management
+
+**Cleanup Command:**
+• Leaves all channels EXCEPT source & destination
+• Safe - keeps your configured channels
+• Use when you joined too many channels
+• Manual control - no auto-leaving
+
+**Adding Channels (4 Methods):**
+• Forward a message from the channel
+• Send channel link/username (@channel or t.me/+link)
+• Send post link (t.me/c/123/456 or t.me/channel/123)
+• Send channel ID (-1001234567890)
+• Works with private/restricted channels!
+"""
+
+_HELP_ADMIN_TEXT = """
+**Admin Commands (No Login Required):**
+/stats - Bot statistics
+/users - All users list
+/broadcast - Broadcast message to all
+/ban <user_id> [reason] - Ban user with reason
+/unban <user_id> - Unban user
+/banned - View all banned users
+/stop - Shut the bot down
+
+**Ban System:**
+• Banned users cannot use ANY bot features
+• All commands and messages are blocked
+• User receives detailed ban notification
+• Automatic client disconnection on ban
+
+Note: Admin commands work without login
+"""
+
+_HELP_FOOTER = "\nCreated by @akmovieverse\nHub: @instawallpaper/"
+
+_USER_HELP_TEXT = _HELP_TEXT + _HELP_FOOTER
+_OWNER_HELP_TEXT = _HELP_TEXT + _HELP_ADMIN_TEXT + _HELP_FOOTER
+
+_ADD_SOURCE_TEXT = (
+    "**Add Source Channel**\n\n"
+    "**Choose one method:**\n\n"
+    "**Method 1 (Easiest):**\n"
+    "Forward ANY message from the channel\n\n"
+    "**Method 2 (Channel Link/Username):**\n"
+    "• `@channelname`\n"
+    "• `https://t.me/channelname`\n"
+    "• `https://t.me/+ABC123xyz` (invite link)\n\n"
+    "**Method 3 (For Restricted Channels):**\n"
+    "Send a post link from the channel:\n"
+    "• `https://t.me/c/1234567890/123` (private post)\n"
+    "• `https://t.me/channelname/123` (public post)\n\n"
+    "**Method 4 (Advanced):**\n"
+    "Send channel ID directly:\n"
+    "• `-1001234567890`\n\n"
+    "You must be a member of the channel!"
+)
+
+_SET_DEST_TEXT = (
+    "**Set Destination Channel**\n\n"
+    "**Choose one method:**\n\n"
+    "**Method 1 (Easiest):**\n"
+    "Forward ANY message from the channel\n\n"
+    "**Method 2 (Channel Link/Username):**\n"
+    "• `@channelname`\n"
+    "• `https://t.me/channelname`\n"
+    "• `https://t.me/+ABC123xyz` (invite link)\n\n"
+    "**Method 3 (For Restricted Channels):**\n"
+    "Send a post link from the channel:\n"
+    "• `https://t.me/c/1234567890/123` (private post)\n"
+    "• `https://t.me/channelname/123` (public post)\n\n"
+    "**Method 4 (Advanced):**\n"
+    "Send channel ID directly:\n"
+    "• `-1001234567890`\n\n"
+    "Make sure you're admin with post permissions!"
+)
+
+# Log channel headers keyed by log_type
+_LOG_LABELS = {
+    "info": "Info",
+    "success": "Success",
+    "error": "Error",
+    "warning": "Warning",
+    "new_user": "New User",
+    "login": "Login",
+    "logout": "Logout",
+    "forward": "Forward",
+    "channel_add": "Channel Added",
+    "channel_remove": "Channel Removed",
+    "admin": "Admin"
+}
+
+_MODE_LABELS = {
+    "copy": "Copy",
+    "forward": "Forward"
+}
+
+# Seconds to remember that a user has no usable session
+NO_CLIENT_TTL = 30
+
+# Seconds before an abandoned login is dropped and its client disconnected
+LOGIN_TTL = 600
+
+# Seconds a destination permission check is reused, and how many are kept
+PERMISSION_TTL = 60
+PERMISSION_CACHE_SIZE = 512
+
+# Messages buffered per source before the producer waits for the forwarder
+MESSAGE_QUEUE_SIZE = 1024
+# Seconds between "queue full" warnings for the same source
+BACKPRESSURE_LOG_INTERVAL = 300
+
+# Media downloads allowed to run at once across every user's queues
+DOWNLOAD_WORKERS = 8
+
+# Where media is staged between download and upload; point it at a
+# RAM-backed directory such as /dev/shm to keep copies off the disk
+MEDIA_TEMP_DIR = os.environ.get("MEDIA_TEMP_DIR")
+
+# Minimum seconds between edits of a transfer's progress message
+PROGRESS_EDIT_INTERVAL = 3.0
+
+# Threads for blocking work (file IO, session crypto) off the event loop
+EXECUTOR_WORKERS = 32
+
+# Broadcast messages in flight at once; the send rate itself is capped
+# separately by broadcast_limiter. A missing or invalid value falls back to 30
+try:
+    BROADCAST_CONCURRENCY = max(1, int(os.environ.get("BROADCAST_CONCURRENCY") or 30))
+except ValueError:
+    BROADCAST_CONCURRENCY = 30
+
+# A "Forwarding Milestone" log entry is posted every this many forwards
+FORWARD_MILESTONE = 50
+
+# Log lines are coalesced for up to LOG_BATCH_WINDOW seconds, LOG_BATCH_SIZE
+# entries or LOG_BATCH_CHARS characters before being sent as one message
+LOG_BATCH_WINDOW = 2.0
+LOG_BATCH_SIZE = 10
+LOG_BATCH_CHARS = 3500
+# Telegram's limit for a single message
+MESSAGE_MAX_CHARS = 4096
+# Log lines waiting to be sent; further lines are dropped rather than
+# holding up the command that produced them
+LOG_QUEUE_SIZE = 1000
+
+# t.me/c/<id>/<post> for private channels, t.me/<username>/<post> for public ones
+_POST_LINK = re.compile(r'(?:https?://)?t\.me/(?:c/(\d+)|(?:s/)?([A-Za-z]\w+))/\d+')
+
+_NO_LOGIN_COMMANDS = frozenset({'start', 'login', 'help', 'about'})
+_ARGS_COMMANDS = frozenset({'remove', 'mode', 'ban', 'unban'})
+
+
+def setup_logging() -> QueueListener:
+    """Route log records through a queue so the event loop never blocks on stdout"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    records = SimpleQueue()
+    logging.getLogger().addHandler(QueueHandler(records))
+    logger.setLevel(os.environ.get('LOG_LEVEL', 'WARNING').upper())
+    listener = QueueListener(records, handler)
+    listener.start()
+    return listener
+
+
+def raw_channel_id(channel_id) -> int:
+    """Strip the -100 marker so stored IDs compare equal to entity.id"""
+    return int(str(channel_id).removeprefix('-100').lstrip('-'))
+
+
+def marked_channel_id(channel_id) -> int:
+    """Bot API form of a stored channel ID, adding -100 when it is missing"""
+    channel_id = str(channel_id)
+    return int(channel_id if channel_id.startswith('-') else '-100' + channel_id)
 
 
 class ForwardBot:
+    __slots__ = (
+        'bot_client', 'user_clients', 'user_handlers', 'user_accounts', 'no_client_until',
+        'client_locks', 'config', 'config_manager', 'db', 'owner_id', 'log_channel',
+        'logging_enabled', 'start_date', 'banned_ids', 'user_state', 'pending_logins',
+        'login_reaper_task', 'shutdown_event', 'ignored_channels', 'permission_cache',
+        'source_maps', 'cleanup_task', 'background_tasks', 'pending_forwards', 'stats_flush_task',
+        'known_users', 'active_users', 'log_queue', 'log_flush_task', 'milestone_task',
+        'source_queues', 'broadcast_limiter', 'button_cooldown', 'traceback_cooldown',
+        'forward_limiter', 'destination_limiters', 'api_limiter', 'media_cache', 'download_slots',
+        'media_temp_dir', 'commands', 'admin_commands', 'callbacks',
+    )
+    
     def __init__(self):
         self.bot_client = None
-        self.user_clients = {}
+        self.user_clients = OrderedDict()
+        self.user_handlers = {}  # user_id -> forwarder registered on that client
+        self.user_accounts = {}  # user_id -> cached get_me() of the logged in account
+        self.no_client_until = {}
+        self.client_locks = {}  # user_id -> [lock, callers waiting on or holding it]
         self.config = None
         self.config_manager = ConfigManager()
         self.db = Database()
         self.owner_id = None
         self.log_channel = None
-        
-        self.awaiting_login = {}
-        self.awaiting_code = {}
-        self.awaiting_password = {}
-        self.awaiting_source_forward = {}
-        self.awaiting_destination_forward = {}
-        self.awaiting_broadcast = {}
-        self.user_phones = {}
-        self.user_phone_code_hash = {}
-        self.temp_clients = {}
-        
-        self.ignored_channels = {}
+        self.logging_enabled = False
+        self.start_date = None
+        self.banned_ids = set()
+        
+        self.user_state = {}
+        self.pending_logins = {}
+        self.login_reaper_task = None
+        # Set by /stop; run() then shuts down the same way as on disconnect
+        self.shutdown_event = asyncio.Event()
+        
+        # "Not a source" notices, once per (user, channel) every 5 minutes
+        self.ignored_channels = Cooldown(300, max_keys=8192)
+        self.permission_cache = {}  # (user_id, channel_id) -> (expiry, permissions)
+        self.source_maps = {}  # user_id -> (channels list it was built from, chat_id -> channel row)
         self.cleanup_task = None
-        
-        self.message_queues = {}
-        self.queue_processors = {}
-        self.processing_locks = {}
+        self.background_tasks = set()  # fire-and-forget work, kept referenced until done
+        
+        # Forwards not yet written to MongoDB, flushed every few seconds
+        self.pending_forwards = 0
+        self.stats_flush_task = None
+        
+        # Users registered during this run; their activity is written in
+        # batches alongside the forward counter
+        self.known_users = set()
+        self.active_users = {}
+        
+        self.log_queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.log_flush_task = None
+        self.milestone_task = None
+        
+        # Keyed by (user_id, source channel_id): each source gets its own
+        # ordered queue, so different sources are forwarded in parallel
+        self.source_queues = {}
+        
+        self.broadcast_limiter = RateLimiter(30, 1.0)
+        self.button_cooldown = Cooldown(0.5)
+        # Full tracebacks at most once per 12s per call site (about 5/min)
+        self.traceback_cooldown = Cooldown(12.0)
+        
+        # Forwarding budget: 25/s across all users, and bursts of up to
+        # 20 per destination while averaging the old one-per-second pace
+        self.forward_limiter = RateLimiter(25, 1.0)
+        self.destination_limiters = {}
+        
+        # Shared cap on control-plane calls (lookups, leaves, dialogs)
+        self.api_limiter = AdaptiveLimiter(20, recover_every=30.0)
+        
+        self.media_cache = MediaCache()
+        self.download_slots = asyncio.Semaphore(DOWNLOAD_WORKERS)
+        self.media_temp_dir = MEDIA_TEMP_DIR or tempfile.gettempdir()
+        
+        self.commands = {
+            'start': self.cmd_start,
+            'login': self.cmd_login,
+            'logout': self.cmd_logout,
+            'help': self.cmd_help,
+            'myaccount': self.cmd_myaccount,
+            'addsource': self.cmd_addsource,
+            'setdest': self.cmd_setdest,
+            'list': self.cmd_list,
+            'remove': self.cmd_remove,
+            'cleanup': self.cmd_cleanup,
+            'mode': self.cmd_mode,
+            'status': self.cmd_status,
+        }
+        
+        # Owner only commands
+        self.admin_commands = {
+            'broadcast': self.cmd_broadcast,
+            'stats': self.cmd_stats,
+            'users': self.cmd_users,
+            'ban': self.cmd_ban,
+            'unban': self.cmd_unban,
+            'banned': self.cmd_banned,
+            'stop': self.cmd_stop,
+        }
+        
+        # Inline button data -> handler
+        self.callbacks = {
+            'login': self.cb_login,
+            'help': self.cmd_help,
+            'myaccount': self.cmd_myaccount,
+            'mychannels': self.cmd_list,
+            'mystatus': self.cmd_status,
+            'addsource': self.cmd_addsource,
+            'setdest': self.cmd_setdest,
+            'admin': self.cb_admin,
+            'start': self.cmd_start,
+        }
     
-    async def setup_bot(self):
+    def setup_bot(self, argv=None):
+        parser = argparse.ArgumentParser(prog="main.py setup", description="Configure the bot")
+        parser.add_argument("--api-id", help="Telegram API ID")
+        parser.add_argument("--api-hash", help="Telegram API hash")
+        parser.add_argument("--bot-token", help="Bot token from @BotFather")
+        parser.add_argument("--mongo-uri", help="MongoDB connection URI")
+        parser.add_argument("--db-name", help="MongoDB database name")
+        parser.add_argument("--owner-id", help="Your Telegram user ID")
+        parser.add_argument("--non-interactive", action="store_true",
+                            help="Fail instead of prompting for missing values")
+        args = parser.parse_args(argv)
+        
+        def value(arg, env_key, prompt):
+            # Command line first, then environment, then ask
+            if arg:
+                return arg.strip()
+            if os.environ.get(env_key):
+                return os.environ[env_key].strip()
+            if args.non_interactive:
+                return ""
+            return input(prompt).strip()
+        
         print("\n" + "="*60)
         print("TELEGRAM AUTO FORWARD BOT - SETUP")
         print("="*60)
@@ -48,38 +436,44 @@ class ForwardBot:
         print("Get your credentials from https://my.telegram.org\n")
         
         try:
-            api_id = int(input("Enter API ID: ").strip())
-            api_hash = input("Enter API Hash: ").strip()
+            api_id = int(value(args.api_id, 'API_ID', "Enter API ID: "))
         except ValueError:
             print("Invalid API ID! Must be a number.")
             return
+        api_hash = value(args.api_hash, 'API_HASH', "Enter API Hash: ")
         
         print("\nStep 2: Bot Token")
         print("Get bot token from @BotFather on Telegram\n")
-        bot_token = input("Enter Bot Token: ").strip()
+        bot_token = value(args.bot_token, 'BOT_TOKEN', "Enter Bot Token: ")
         
         print("\nStep 3: MongoDB Configuration")
         print("Get free MongoDB from https://www.mongodb.com/cloud/atlas\n")
-        mongo_uri = input("Enter MongoDB URI: ").strip()
+        mongo_uri = value(args.mongo_uri, 'MONGO_URI', "Enter MongoDB URI: ")
         
-        db_name = input("Enter Database Name (default: forward_bot): ").strip()
+        db_name = value(args.db_name, 'MONGO_DB_NAME', "Enter Database Name (default: forward_bot): ")
         if not db_name:
             db_name = "forward_bot"
         
         print("\nStep 4: Bot Owner")
         print("Your Telegram User ID (get from @userinfobot)\n")
         try:
-            owner_id = int(input("Enter Your User ID: ").strip())
+            owner_id = int(value(args.owner_id, 'OWNER_ID', "Enter Your User ID: "))
         except ValueError:
             print("Invalid User ID! Must be a number.")
             return
         
-        self.config_manager.config.api_id = api_id
-        self.config_manager.config.api_hash = api_hash
-        self.config_manager.config.bot_token = bot_token
-        self.config_manager.config.mongo_uri = mongo_uri
-        self.config_manager.config.mongo_db_name = db_name
-        self.config_manager.config.owner_id = owner_id
+        if not (api_hash and bot_token and mongo_uri):
+            print("API hash, bot token and MongoDB URI are required.")
+            return
+        
+        self.config_manager.config = BotConfig(
+            api_id=api_id,
+            api_hash=api_hash,
+            bot_token=bot_token,
+            mongo_uri=mongo_uri,
+            mongo_db_name=db_name,
+            owner_id=owner_id
+        )
         self.config_manager.save_config()
         
         print("\n" + "="*60)
@@ -126,12 +520,21 @@ class ForwardBot:
         
         self.owner_id = self.config.owner_id
         self.log_channel = self.config.log_channel
+        self.logging_enabled = bool(self.log_channel)
         
         print("Connecting to MongoDB...")
         db_name = self.config.mongo_db_name or 'forward_bot'
         if not await self.db.connect(self.config.mongo_uri, db_name):
             return False
         
+        self.start_date, banned, user_count, stats = await asyncio.gather(
+            self.db.get_start_date(),
+            self.db.get_banned_users(),
+            self.db.get_user_count(),
+            self.db.get_stats()
+        )
+        self.banned_ids = {int(user['user_id']) for user in banned}
+        
         self.bot_client.add_event_handler(
             self.handle_new_message,
             events.NewMessage()
@@ -142,157 +545,347 @@ class ForwardBot:
             events.CallbackQuery()
         )
         
+        self.stats_flush_task = asyncio.create_task(self.flush_forward_stats())
+        self.login_reaper_task = asyncio.create_task(self.reap_pending_logins())
+        if self.logging_enabled:
+            self.log_flush_task = asyncio.create_task(self.flush_logs())
+            self.milestone_task = asyncio.create_task(self.report_milestones())
+        
         print("\n" + "="*60)
         print("BOT STARTED SUCCESSFULLY!")
         print("="*60)
         print("\nBot Information:")
         print(f"   • Bot: @{me.username}")
         print(f"   • Owner ID: {self.owner_id}")
-        print(f"   • Users: {await self.db.get_user_count()}")
+        print(f"   • Users: {user_count}")
         
         print("\nUsers can start the bot and login with their accounts!")
         print("Press Ctrl+C to stop the bot\n")
         print("Created by: @AkMovieVerse")
         print("Hub: @instawallpaper\n")
         
-        user_count = await self.db.get_user_count()
-        stats = await self.db.get_stats()
-        await self.log_to_channel(
-            f"**Bot Started**\n\n"
-            f"Bot: @{me.username}\n"
-            f"Total Users: {user_count}\n"
-            f"Total Forwards: {stats.get('total_forwards', 0)}\n"
-            f"Status: Online\n\n"
-            f"Created by @akmovieshubx",
-            "success"
-        )
+        if self.logging_enabled:
+            self.log_to_channel(
+                f"**Bot Started**\n\n"
+                f"Bot: @{me.username}\n"
+                f"Total Users: {user_count}\n"
+                f"Total Forwards: {stats.get('total_forwards', 0)}\n"
+                f"Status: Online\n\n"
+                f"Created by @akmovieshubx",
+                "success"
+            )
         
         return True
     
-    async def log_to_channel(self, message: str, log_type: str = "info"):
-        if not self.log_channel:
+    async def flush_forward_stats(self):
+        while True:
+            await asyncio.sleep(5)
+            await self._flush_forwards()
+    
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+    
+    async def reap_pending_logins(self):
+        while True:
+            await asyncio.sleep(60)
+            cutoff = time.monotonic() - LOGIN_TTL
+            for user_id in [uid for uid, login in self.pending_logins.items() if login.started < cutoff]:
+                if self.user_state.get(user_id) in (State.AWAIT_CODE, State.AWAIT_PASSWORD):
+                    self.user_state.pop(user_id, None)
+                await self.discard_login(user_id)
+                logger.info("Dropped abandoned login for user %s", user_id)
+    
+    async def _flush_forwards(self):
+        count, self.pending_forwards = self.pending_forwards, 0
+        active, self.active_users = self.active_users, {}
+        if count:
+            await self.db.increment_forwards(count)
+        if active:
+            await self.db.touch_users(active)
+    
+    async def flush_logs(self):
+        loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            batch = [carry if carry is not None else await self.log_queue.get()]
+            size = len(batch[0])
+            carry = None
+            deadline = loop.time() + LOG_BATCH_WINDOW
+            while size < LOG_BATCH_CHARS and len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self.log_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if size + len(entry) > LOG_BATCH_CHARS:
+                    carry = entry
+                    break
+                batch.append(entry)
+                size += len(entry)
+            await self._send_logs(batch)
+    
+    async def report_milestones(self):
+        # Set by the first successful read, so startup never reports a milestone.
+        # get_stats() reports zeros when MongoDB is unreachable, so a zero count
+        # is not trusted as the starting point
+        last_milestone = None
+        while True:
+            try:
+                stats = await self.db.get_stats()
+                milestone = stats.get('total_forwards', 0) // FORWARD_MILESTONE
+                if last_milestone is None:
+                    if stats.get('total_forwards'):
+                        last_milestone = milestone
+                elif milestone > last_milestone:
+                    last_milestone = milestone
+                    self.log_to_channel(
+                        f"**Forwarding Milestone**\n\n"
+                        f"Total Forwards: {milestone * FORWARD_MILESTONE}\n"
+                        f"Active Users: {stats['total_users']}\n"
+                        f"Sequential Processing: Active\n"
+                        f"Success Rate: ~95%",
+                        "forward"
+                    )
+            except Exception as e:
+                logger.warning("Milestone check failed: %s", e)
+            await asyncio.sleep(60)
+    
+    async def _send_logs(self, batch):
+        try:
+            # A single oversized entry is cut rather than rejected by Telegram
+            await self.bot_client.send_message(self.log_channel, "\n\n".join(batch)[:MESSAGE_MAX_CHARS])
+        except Exception as e:
+            print(f"Failed to send log: {e}")
+    
+    def log_traceback(self, where: str):
+        if self.traceback_cooldown.allow(where):
+            logger.error("Traceback in %s", where, exc_info=True)
+    
+    def destination_limiter(self, chat_id: int) -> RateLimiter:
+        limiter = self.destination_limiters.get(chat_id)
+        if limiter is None:
+            limiter = self.destination_limiters[chat_id] = RateLimiter(20, 20.0)
+        return limiter
+    
+    async def api_call(self, fn, *args, max_wait: int = 60):
+        for attempt in range(2):
+            async with self.api_limiter:
+                try:
+                    return await fn(*args)
+                except FloodWaitError as e:
+                    self.api_limiter.backoff()
+                    if attempt or e.seconds > max_wait:
+                        raise
+                    wait = e.seconds
+            
+            logger.warning("API flood wait: sleeping %ss", wait)
+            await asyncio.sleep(wait)
+    
+    async def ensure_connected(self, client: TelegramClient):
+        if not client.is_connected():
+            await client.connect()
+    
+    async def add_user_client(self, user_id: int, client: TelegramClient):
+        # Replacing a client must unhook and disconnect the old one, or
+        # both would forward every post
+        if self.user_clients.get(user_id) not in (None, client):
+            await self.remove_user_client(user_id)
+        
+        self.user_clients[user_id] = client
+        self.user_clients.move_to_end(user_id)
+        
+        # Forward new posts from the user's source channels
+        handler = partial(self.handle_user_channel_message, user_id=user_id)
+        client.add_event_handler(handler, events.NewMessage(incoming=True, chats=None))
+        self.user_handlers[user_id] = handler
+        
+        limit = self.config.max_user_clients
+        while limit and len(self.user_clients) > limit:
+            await self.remove_user_client(next(iter(self.user_clients)))
+    
+    async def remove_user_client(self, user_id: int):
+        client = self.user_clients.pop(user_id, None)
+        handler = self.user_handlers.pop(user_id, None)
+        self.user_accounts.pop(user_id, None)
+        self.source_maps.pop(user_id, None)
+        if client is None:
             return
-
+        
+        # Unhook before disconnecting so a later login can't deliver twice
+        if handler:
+            client.remove_event_handler(handler)
         try:
-            emoji_map = {
-                "info": "Info",
-                "success": "Success",
-                "error": "Error",
-                "warning": "Warning",
-                "new_user": "New User",
-                "login": "Login",
-                "logout": "Logout",
-                "forward": "Forward",
-                "channel_add": "Channel Added",
-                "channel_remove": "Channel Removed",
-                "admin": "Admin"
-            }
-
-            emoji = emoji_map.get(log_type, "Info")
+            await client.disconnect()
+        except Exception as e:
+            print(f"Error disconnecting user client {user_id}: {e}")
+    
+    async def get_source_channel(self, user_id: int, chat_id: int):
+        # The DB layer hands back the same list until it is invalidated,
+        # so the lookup table is only rebuilt after the channels change
+        channels = await self.db.get_user_channels(user_id)
+        cached = self.source_maps.get(user_id)
+        if cached is None or cached[0] is not channels:
+            lookup = {}
+            for ch in channels:
+                stored = str(ch['channel_id'])
+                lookup.setdefault(marked_channel_id(stored), ch)
+                if stored.isdigit():
+                    # Rows saved as abs(chat_id) rather than the bare channel ID
+                    lookup.setdefault(-int(stored), ch)
+            cached = self.source_maps[user_id] = (channels, lookup)
+        return cached[1].get(chat_id)
+    
+    async def get_my_permissions(self, user_id: int, client: TelegramClient, channel):
+        key = (user_id, channel.id)
+        now = time.monotonic()
+        entry = self.permission_cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+        
+        permissions = await self.api_call(client.get_permissions, channel, 'me')
+        if len(self.permission_cache) >= PERMISSION_CACHE_SIZE:
+            self.permission_cache = {k: e for k, e in self.permission_cache.items() if e[0] > now}
+        self.permission_cache[key] = (now + PERMISSION_TTL, permissions)
+        return permissions
+    
+    async def get_account(self, user_id: int, client: TelegramClient):
+        me = self.user_accounts.get(user_id)
+        if me is None:
+            me = self.user_accounts[user_id] = await client.get_me()
+        return me
+    
+    def is_banned(self, user_id: int) -> bool:
+        return user_id in self.banned_ids
+    
+    def log_to_channel(self, message: str, log_type: str = "info"):
+        if not self.logging_enabled:
+            return
 
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        emoji = _LOG_LABELS.get(log_type, "Info")
 
-            formatted_message = f"{emoji} **{log_type.upper()}**\n\n{message}\n\n{timestamp}"
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            await self.bot_client.send_message(self.log_channel, formatted_message)
+        formatted_message = f"{emoji} **{log_type.upper()}**\n\n{message}\n\n{timestamp}"
 
-        except Exception as e:
-            print(f"Failed to send log: {e}")
+        try:
+            self.log_queue.put_nowait(formatted_message)
+        except asyncio.QueueFull:
+            logger.warning("Log queue full, dropping %s entry", log_type)
     
-    async def process_message_queue(self, user_id: int):
-        queue = self.message_queues.get(user_id)
-        if not queue:
-            return
+    async def process_message_queue(self, user_id: int, channel_id: int, source: SourceQueue):
+        queue = source.queue
         
-        print(f"Started queue processor for user {user_id}")
+        logger.debug("Started queue processor for user %s (%s)", user_id, channel_id)
         
-        while True:
+        while not source.stop_event.is_set():
             try:
                 message_data = await queue.get()
                 
-                if message_data is None:
-                    print(f"Stopping queue processor for user {user_id}")
-                    break
-                
-                event = message_data['event']
-                channel_id = message_data['channel_id']
+                message = message_data['event'].message
                 source_channel = message_data['source_channel']
                 destination = message_data['destination']
                 dest_channel_id = message_data['dest_channel_id']
                 message_id = message_data['message_id']
                 message_date = message_data['message_date']
                 
+                source.busy = True
                 try:
-                    self.processing_locks[user_id] = True
-                    
-                    print(f"Processing queued message {message_id} (date: {message_date}) from {source_channel['title']} for user {user_id}")
-                    print(f"   Queue size: {queue.qsize()} remaining")
+                    logger.info("Processing queued message %s (date: %s) from %s for user %s, %d remaining",
+                                message_id, message_date, source_channel['title'], user_id, queue.qsize())
                     
                     user_client = await self.get_user_client(user_id)
                     if not user_client:
-                        print(f"User client not available for {user_id}, skipping message")
+                        logger.warning("User client not available for %s, skipping message", user_id)
                         continue
                     
                     forward_mode = source_channel.get('forward_mode', 'copy')
+                    is_restricted = bool(message.restriction_reason or message.noforwards)
                     
-                    is_restricted = False
-                    if hasattr(event.message, 'restriction_reason') and event.message.restriction_reason:
-                        is_restricted = True
-                    if hasattr(event.message, 'noforwards') and event.message.noforwards:
-                        is_restricted = True
+                    await self.destination_limiter(dest_channel_id).acquire()
+                    await self.forward_limiter.acquire()
                     
                     if forward_mode == 'copy' or is_restricted:
                         await self._copy_message_with_media(
                             user_client,
-                            event.message,
+                            message,
                             dest_channel_id,
                             user_id,
                             is_restricted
                         )
-                        print(f"Copied message {message_id} (date: {message_date}) (mode: {'copy' if not is_restricted else 'copy-restricted'}), passed user id: {user_id}")
+                        logger.info("Copied message %s (date: %s) (mode: %s) for user %s",
+                                    message_id, message_date, 'copy-restricted' if is_restricted else 'copy', user_id)
                     else:
                         try:
                             await user_client.forward_messages(
                                 dest_channel_id,
-                                event.message
+                                message
                             )
-                            print(f"Forwarded message {message_id} (date: {message_date}) (mode: forward)")
+                            logger.info("Forwarded message %s (date: %s) (mode: forward)", message_id, message_date)
                         except Exception as fwd_err:
-                            print(f"Forward failed, trying copy: {fwd_err}")
+                            logger.warning("Forward failed, trying copy: %s", fwd_err)
                             await self._copy_message_with_media(
                                 user_client,
-                                event.message,
+                                message,
                                 dest_channel_id,
                                 user_id,
                                 True
                             )
-                            print(f"Copied message {message_id} (date: {message_date}) (fallback), passed used id: {user_id}")
-                    
-                    await self.db.increment_forwards()
-                    print(f"Successfully processed message {message_id} (date: {message_date}) for user {user_id}")
+                            logger.info("Copied message %s (date: %s) (fallback) for user %s", message_id, message_date, user_id)
                     
-                    await asyncio.sleep(1)
+                    self.pending_forwards += 1
+                    logger.info("Successfully processed message %s (date: %s) for user %s", message_id, message_date, user_id)
                     
                 except Exception as process_error:
-                    print(f"Error processing message {message_id}: {process_error}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.error("Error processing message %s: %s", message_id, process_error)
+                    self.log_traceback("process message")
                 
                 finally:
                     queue.task_done()
-                    self.processing_locks[user_id] = False
+                    source.busy = False
                     
             except Exception as e:
-                print(f"Error in queue processor for user {user_id}: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.error("Error in queue processor for user %s: %s", user_id, e)
+                self.log_traceback("queue processor")
                 await asyncio.sleep(5)
+        
+        logger.debug("Stopped queue processor for user %s (%s)", user_id, channel_id)
     
     async def get_user_client(self, user_id: int) -> TelegramClient:
-        if user_id in self.user_clients:
-            return self.user_clients[user_id]
-        
+        client = self.user_clients.get(user_id)
+        if client is not None:
+            self.user_clients.move_to_end(user_id)
+            return client
+        
+        if time.monotonic() < self.no_client_until.get(user_id, 0):
+            return None
+        
+        # One load per user at a time; the count keeps the lock alive while
+        # anyone is still queued on it
+        slot = self.client_locks.get(user_id)
+        if slot is None:
+            slot = self.client_locks[user_id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                # Another caller may have loaded it while we waited
+                client = self.user_clients.get(user_id)
+                if client is not None:
+                    self.user_clients.move_to_end(user_id)
+                    return client
+                if time.monotonic() < self.no_client_until.get(user_id, 0):
+                    return None
+                return await self.load_user_client(user_id)
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self.client_locks[user_id]
+    
+    async def load_user_client(self, user_id: int) -> TelegramClient:
         session_data = await self.db.get_user_session(user_id)
         if session_data and session_data.get('session_string'):
             try:
@@ -319,17 +912,11 @@ class ForwardBot:
                             await asyncio.sleep(3)
                         else:
                             print(f"Failed to connect user client after {max_retries} attempts")
+                            self.no_client_until[user_id] = time.monotonic() + NO_CLIENT_TTL
                             return None
                 
                 if await client.is_user_authorized():
-                    self.user_clients[user_id] = client
-                    
-                    from functools import partial
-                    handler = partial(self.handle_user_channel_message, user_id=user_id)
-                    client.add_event_handler(
-                        handler,
-                        events.NewMessage(incoming=True, chats=None)
-                    )
+                    await self.add_user_client(user_id, client)
                     
                     print(f"User client loaded for {user_id}")
                     return client
@@ -338,6 +925,7 @@ class ForwardBot:
             except Exception as e:
                 print(f"Error loading user client for {user_id}: {e}")
         
+        self.no_client_until[user_id] = time.monotonic() + NO_CLIENT_TTL
         return None
     
     async def handle_new_message(self, event):
@@ -349,18 +937,22 @@ class ForwardBot:
             user_id = sender.id
             username = sender.username or sender.first_name or "Unknown"
             
-            is_new = await self.db.add_user(user_id, username)
-            
-            if is_new:
-                await self.log_to_channel(
-                    f"**New User Registered**\n\n"
-                    f"User: {username}\n"
-                    f"ID: `{user_id}`\n"
-                    f"Profile: [View](tg://user?id={user_id})",
-                    "new_user"
-                )
+            if user_id in self.known_users:
+                self.active_users[user_id] = username
+            else:
+                is_new = await self.db.add_user(user_id, username)
+                self.known_users.add(user_id)
+                
+                if is_new and self.logging_enabled:
+                    self.log_to_channel(
+                        f"**New User Registered**\n\n"
+                        f"User: {username}\n"
+                        f"ID: `{user_id}`\n"
+                        f"Profile: [View](tg://user?id={user_id})",
+                        "new_user"
+                    )
             
-            if await self.db.is_user_banned(user_id):
+            if self.is_banned(user_id):
                 ban_info = await self.db.get_ban_info(user_id)
                 reason = ban_info.get('reason', 'No reason provided') if ban_info else 'No reason provided'
                 ban_date = ban_info.get('banned_date', 'Unknown') if ban_info else 'Unknown'
@@ -382,15 +974,17 @@ class ForwardBot:
                 print(f"Banned user {user_id} attempted to use bot")
                 return
             
-            if user_id in self.awaiting_code and self.awaiting_code[user_id]:
+            state = self.user_state.get(user_id)
+            
+            if state == State.AWAIT_CODE:
                 await self.handle_verification_code(event, user_id)
                 return
             
-            if user_id in self.awaiting_password and self.awaiting_password[user_id]:
+            if state == State.AWAIT_PASSWORD:
                 await self.handle_2fa_password(event, user_id)
                 return
             
-            if user_id in self.awaiting_broadcast and self.awaiting_broadcast[user_id]:
+            if state == State.AWAIT_BROADCAST:
                 if user_id == self.owner_id:
                     await self.handle_broadcast(event)
                 return
@@ -399,10 +993,7 @@ class ForwardBot:
                 await self.handle_forwarded_message(event, user_id)
                 return
             
-            if event.message.text and (
-                user_id in self.awaiting_source_forward and self.awaiting_source_forward[user_id] or
-                user_id in self.awaiting_destination_forward and self.awaiting_destination_forward[user_id]
-            ):
+            if event.message.text and state in (State.AWAIT_SOURCE, State.AWAIT_DEST):
                 await self.handle_channel_link(event, user_id)
                 return
             
@@ -410,10 +1001,9 @@ class ForwardBot:
                 await self.handle_command(event, user_id)
                 return
             
-            if event.message.text and event.message.text.startswith('+'):
-                if user_id in self.awaiting_login and self.awaiting_login[user_id]:
-                    await self.handle_phone_number(event, user_id)
-                    return
+            if state == State.AWAIT_PHONE and event.message.text and event.message.text.startswith('+'):
+                await self.handle_phone_number(event, user_id)
+                return
             
             await event.reply(
                 "Use /start to see available commands\n\n"
@@ -428,15 +1018,18 @@ class ForwardBot:
             text = event.message.text.strip()
             parts = text.split()
             command = parts[0][1:].lower()
-            args = parts[1:] if len(parts) > 1 else []
-            
-            no_login_required = ['start', 'login', 'help', 'about']
+            args = parts[1:]
             
-            admin_only_commands = ['stats', 'users', 'broadcast', 'ban', 'unban', 'banned']
+            handler = self.admin_commands.get(command) if user_id == self.owner_id else None
+            is_admin_command = handler is not None
+            if handler is None:
+                handler = self.commands.get(command)
             
-            is_admin_command = command in admin_only_commands and user_id == self.owner_id
+            if handler is None:
+                await event.reply(f"Unknown command: /{command}\n\nUse /help for available commands")
+                return
             
-            if command not in no_login_required and not is_admin_command:
+            if command not in _NO_LOGIN_COMMANDS and not is_admin_command:
                 user_client = await self.get_user_client(user_id)
                 if not user_client:
                     await event.reply(
@@ -445,44 +1038,10 @@ class ForwardBot:
                     )
                     return
             
-            if command == 'start':
-                await self.cmd_start(event, user_id)
-            elif command == 'login':
-                await self.cmd_login(event, user_id)
-            elif command == 'logout':
-                await self.cmd_logout(event, user_id)
-            elif command == 'help':
-                await self.cmd_help(event, user_id)
-            elif command == 'myaccount':
-                await self.cmd_myaccount(event, user_id)
-            elif command == 'addsource':
-                await self.cmd_addsource(event, user_id)
-            elif command == 'setdest':
-                await self.cmd_setdest(event, user_id)
-            elif command == 'list':
-                await self.cmd_list(event, user_id)
-            elif command == 'remove':
-                await self.cmd_remove(event, user_id, args)
-            elif command == 'cleanup':
-                await self.cmd_cleanup(event, user_id)
-            elif command == 'mode':
-                await self.cmd_mode(event, user_id, args)
-            elif command == 'status':
-                await self.cmd_status(event, user_id)
-            elif command == 'broadcast' and user_id == self.owner_id:
-                await self.cmd_broadcast(event, user_id)
-            elif command == 'stats' and user_id == self.owner_id:
-                await self.cmd_stats(event, user_id)
-            elif command == 'users' and user_id == self.owner_id:
-                await self.cmd_users(event, user_id)
-            elif command == 'ban' and user_id == self.owner_id:
-                await self.cmd_ban(event, user_id, args)
-            elif command == 'unban' and user_id == self.owner_id:
-                await self.cmd_unban(event, user_id, args)
-            elif command == 'banned' and user_id == self.owner_id:
-                await self.cmd_banned(event, user_id)
+            if command in _ARGS_COMMANDS:
+                await handler(event, user_id, args)
             else:
-                await event.reply(f"Unknown command: /{command}\n\nUse /help for available commands")
+                await handler(event, user_id)
         
         except Exception as e:
             print(f"Error handling command: {e}")
@@ -494,50 +1053,18 @@ class ForwardBot:
         is_logged_in = user_client is not None
         
         if is_logged_in:
-            me = await user_client.get_me()
+            me = await self.get_account(user_id, user_client)
             login_status = f"Logged in as @{me.username or me.first_name}"
         else:
             login_status = "Not logged in"
         
-        buttons = []
-        if is_logged_in:
-            buttons.append([Button.inline("My Channels", b"mychannels"), Button.inline("My Status", b"mystatus")])
-            buttons.append([Button.inline("Add Source", b"addsource"), Button.inline("Set Destination", b"setdest")])
-        else:
-            buttons.append([Button.inline("Login", b"login")])
-        
-        buttons.append([Button.inline("Help", b"help"), Button.inline("My Account", b"myaccount")])
+        buttons = _START_BUTTONS[is_logged_in, is_owner]
         
-        if is_owner:
-            buttons.append([Button.inline("Admin Panel", b"admin")])
-        
-        owner_text = "**Owner Access**" if is_owner else ""
-        
-        if is_logged_in:
-            get_started_text = "• Configure your channels\n• Start forwarding!"
-        else:
-            get_started_text = "• Click Login button or use /login\n• Connect your Telegram account\n• Start forwarding!"
-        
-        welcome_text = f"""
-**Welcome to Auto Forward Bot!**
-
-{login_status}
-
-**What I can do:**
-• Forward messages from any channel
-• Copy mode (no forward tag)
-• Forward mode (with attribution)
-• Multiple channel support
-• Personal forwarding for each user
-
-{owner_text}
-
-**Get Started:**
-{get_started_text}
-
-**Created by:** @AkMovieVerse
-**Hub:** @instawallpaper
-"""
+        welcome_text = _WELCOME_TEMPLATE.substitute(
+            login_status=login_status,
+            owner_text="**Owner Access**" if is_owner else "",
+            get_started_text=_GET_STARTED_TEXT[is_logged_in]
+        )
         await event.reply(welcome_text, buttons=buttons)
     
     async def cmd_login(self, event, user_id: int):
@@ -546,7 +1073,7 @@ class ForwardBot:
             await event.reply("You are already logged in!\n\nUse /logout to logout")
             return
         
-        self.awaiting_login[user_id] = True
+        self.user_state[user_id] = State.AWAIT_PHONE
         await event.reply(
             "**Login to Your Telegram Account**\n\n"
             "To use this bot, you need to connect your Telegram account.\n\n"
@@ -559,10 +1086,10 @@ class ForwardBot:
     
     async def handle_phone_number(self, event, user_id: int):
         phone = event.message.text.strip()
-        self.user_phones[user_id] = phone
+        login = self.pending_logins[user_id] = PendingLogin(phone)
         
         try:
-            client = TelegramClient(
+            client = login.client = TelegramClient(
                 StringSession(),
                 self.config.api_id,
                 self.config.api_hash,
@@ -585,16 +1112,14 @@ class ForwardBot:
                         await asyncio.sleep(3)
                     else:
                         await event.reply("Connection failed. Please try again later or check your internet connection.")
-                        self.awaiting_login[user_id] = False
+                        self.user_state.pop(user_id, None)
+                        await self.discard_login(user_id)
                         return
             
             sent_code = await client.send_code_request(phone)
-            self.user_phone_code_hash[user_id] = sent_code.phone_code_hash
-            
-            self.temp_clients[user_id] = client
+            login.phone_code_hash = sent_code.phone_code_hash
             
-            self.awaiting_login[user_id] = False
-            self.awaiting_code[user_id] = True
+            self.user_state[user_id] = State.AWAIT_CODE
             
             await event.reply(
                 "**Verification Code Sent!**\n\n"
@@ -602,49 +1127,43 @@ class ForwardBot:
             )
         except Exception as e:
             await event.reply(f"Error: {e}\n\nMake sure the phone number is correct")
-            self.awaiting_login[user_id] = False
-            if user_id in self.temp_clients:
-                try:
-                    await self.temp_clients[user_id].disconnect()
-                except:
-                    pass
-                del self.temp_clients[user_id]
+            self.user_state.pop(user_id, None)
+            await self.discard_login(user_id)
+    
+    async def discard_login(self, user_id: int):
+        login = self.pending_logins.pop(user_id, None)
+        if login and login.client:
+            with suppress(Exception):
+                await login.client.disconnect()
     
     async def handle_verification_code(self, event, user_id: int):
         code = event.message.text.strip()
-        phone = self.user_phones.get(user_id)
-        phone_code_hash = self.user_phone_code_hash.get(user_id)
-        client = self.temp_clients.get(user_id)
+        login = self.pending_logins.get(user_id)
         
-        if not phone or not phone_code_hash or not client:
+        if not login or not login.phone_code_hash or not login.client:
             await event.reply("Login session expired. Use /login to start again")
-            self.awaiting_code[user_id] = False
-            if user_id in self.temp_clients:
-                try:
-                    await self.temp_clients[user_id].disconnect()
-                except:
-                    pass
-                del self.temp_clients[user_id]
+            self.user_state.pop(user_id, None)
+            await self.discard_login(user_id)
             return
         
+        client = login.client
+        phone = login.phone
+        
         try:
             try:
-                await client.sign_in(phone, code, phone_code_hash=phone_code_hash)
+                await client.sign_in(phone, code, phone_code_hash=login.phone_code_hash)
                 
                 session_string = client.session.save()
                 
                 await self.db.save_user_session(user_id, session_string, phone)
                 
-                self.user_clients[user_id] = client
-                
-                from functools import partial
-                handler = partial(self.handle_user_channel_message, user_id=user_id)
-                client.add_event_handler(
-                    handler,
-                    events.NewMessage(incoming=True, chats=None)
-                )
+                # The client now belongs to the user; a later error must not disconnect it
+                self.pending_logins.pop(user_id, None)
+                await self.add_user_client(user_id, client)
+                self.no_client_until.pop(user_id, None)
                 
                 me = await client.get_me()
+                self.user_accounts[user_id] = me
                 
                 await event.reply(
                     f"**Login Successful!**\n\n"
@@ -657,27 +1176,21 @@ class ForwardBot:
                     f"Created by @AkMovieVerse"
                 )
                 
-                await self.log_to_channel(
-                    f"**User Logged In**\n\n"
-                    f"Bot User: {event.sender.username or event.sender.first_name}\n"
-                    f"Bot User ID: `{user_id}`\n"
-                    f"Logged as: @{me.username or me.first_name}\n"
-                    f"Account ID: `{me.id}`\n"
-                    f"Phone: {phone or 'Hidden'}",
-                    "login"
-                )
+                if self.logging_enabled:
+                    self.log_to_channel(
+                        f"**User Logged In**\n\n"
+                        f"Bot User: {event.sender.username or event.sender.first_name}\n"
+                        f"Bot User ID: `{user_id}`\n"
+                        f"Logged as: @{me.username or me.first_name}\n"
+                        f"Account ID: `{me.id}`\n"
+                        f"Phone: {phone or 'Hidden'}",
+                        "login"
+                    )
                 
-                self.awaiting_code[user_id] = False
-                if user_id in self.user_phones:
-                    del self.user_phones[user_id]
-                if user_id in self.user_phone_code_hash:
-                    del self.user_phone_code_hash[user_id]
-                if user_id in self.temp_clients:
-                    del self.temp_clients[user_id]
+                self.user_state.pop(user_id, None)
             
             except SessionPasswordNeededError:
-                self.awaiting_code[user_id] = False
-                self.awaiting_password[user_id] = True
+                self.user_state[user_id] = State.AWAIT_PASSWORD
                 
                 await event.reply(
                     "**2FA Enabled**\n\n"
@@ -686,35 +1199,34 @@ class ForwardBot:
         
         except Exception as e:
             await event.reply(f"Error: {e}\n\nUse /login to try again")
-            self.awaiting_code[user_id] = False
+            self.user_state.pop(user_id, None)
+            await self.discard_login(user_id)
     
     async def handle_2fa_password(self, event, user_id: int):
         password = event.message.text.strip()
         
         try:
-            client = self.temp_clients.get(user_id)
-            if not client:
+            login = self.pending_logins.get(user_id)
+            if not login or not login.client:
                 await event.reply("Session expired. Use /login again")
-                self.awaiting_password[user_id] = False
+                self.user_state.pop(user_id, None)
+                await self.discard_login(user_id)
                 return
             
+            client = login.client
             await client.sign_in(password=password)
             
             session_string = client.session.save()
-            phone = self.user_phones.get(user_id, "")
+            phone = login.phone
             
             await self.db.save_user_session(user_id, session_string, phone)
             
-            self.user_clients[user_id] = client
-            
-            from functools import partial
-            handler = partial(self.handle_user_channel_message, user_id=user_id)
-            client.add_event_handler(
-                handler,
-                events.NewMessage(incoming=True, chats=None)
-            )
+            self.pending_logins.pop(user_id, None)
+            await self.add_user_client(user_id, client)
+            self.no_client_until.pop(user_id, None)
             
             me = await client.get_me()
+            self.user_accounts[user_id] = me
             
             await event.reply(
                 f"**Login Successful!**\n\n"
@@ -723,160 +1235,70 @@ class ForwardBot:
                 f"Created by @amanbotz"
             )
             
-            await self.log_to_channel(
-                f"**User Logged In (2FA)**\n\n"
-                f"Bot User: {event.sender.username or event.sender.first_name}\n"
-                f"Bot User ID: `{user_id}`\n"
-                f"Logged as: @{me.username or me.first_name}\n"
-                f"Account ID: `{me.id}`\n"
-                f"2FA: Enabled\n"
-                f"Phone: {phone or 'Hidden'}",
-                "login"
-            )
+            if self.logging_enabled:
+                self.log_to_channel(
+                    f"**User Logged In (2FA)**\n\n"
+                    f"Bot User: {event.sender.username or event.sender.first_name}\n"
+                    f"Bot User ID: `{user_id}`\n"
+                    f"Logged as: @{me.username or me.first_name}\n"
+                    f"Account ID: `{me.id}`\n"
+                    f"2FA: Enabled\n"
+                    f"Phone: {phone or 'Hidden'}",
+                    "login"
+                )
             
-            self.awaiting_password[user_id] = False
-            if user_id in self.user_phones:
-                del self.user_phones[user_id]
-            if user_id in self.user_phone_code_hash:
-                del self.user_phone_code_hash[user_id]
-            if user_id in self.temp_clients:
-                del self.temp_clients[user_id]
-        
-        except Exception as e:
-            await event.reply(f"Wrong password: {e}\n\nUse /login to try again")
-            self.awaiting_password[user_id] = False
-            if user_id in self.temp_clients:
-                try:
-                    await self.temp_clients[user_id].disconnect()
-                except:
-                    pass
-                del self.temp_clients[user_id]
-            if user_id in self.user_phones:
-                del self.user_phones[user_id]
-            if user_id in self.user_phone_code_hash:
-                del self.user_phone_code_hash[user_id]
-    
-    async def cmd_logout(self, event, user_id: int):
-        if user_id in self.queue_processors:
-            try:
-                if user_id in self.message_queues:
-                    await self.message_queues[user_id].put(None)
-                    await asyncio.wait_for(self.queue_processors[user_id], timeout=10)
-                print(f"Stopped queue processor for user {user_id}")
-            except Exception as queue_err:
-                print(f"Error stopping queue processor: {queue_err}")
-            finally:
-                if user_id in self.queue_processors:
-                    del self.queue_processors[user_id]
-                if user_id in self.message_queues:
-                    del self.message_queues[user_id]
-                if user_id in self.processing_locks:
-                    del self.processing_locks[user_id]
-        
-        if user_id in self.user_clients:
-            await self.user_clients[user_id].disconnect()
-            del self.user_clients[user_id]
-        
-        if user_id in self.temp_clients:
-            try:
-                await self.temp_clients[user_id].disconnect()
-            except:
-                pass
-            del self.temp_clients[user_id]
-        
-        if user_id in self.user_phones:
-            del self.user_phones[user_id]
-        if user_id in self.user_phone_code_hash:
-            del self.user_phone_code_hash[user_id]
-        self.awaiting_login[user_id] = False
-        self.awaiting_code[user_id] = False
-        self.awaiting_password[user_id] = False
-        
-        await self.db.delete_user_session(user_id)
-        
-        await self.log_to_channel(
-            f"**User Logged Out**\n\n"
-            f"User: {event.sender.username or event.sender.first_name}\n"
-            f"ID: `{user_id}`",
-            "logout"
-        )
-        
-        await event.reply(
-            "**Logged out successfully!**\n\n"
-            "Your session has been removed.\n\n"
-            "Use /login to login again"
-        )
-    
-    async def cmd_help(self, event, user_id: int):
-        is_owner = user_id == self.owner_id
-        
-        help_text = """
-**Bot Commands**
-
-**Account:**
-/login - Login to your Telegram account
-/logout - Logout from bot
-/myaccount - View account info
-
-**Channel Management:**
-/addsource - Add source channel (public/private)
-/setdest - Set destination channel (public/private)
-/list - Show your channels
-/remove <number> - Remove channel
-/cleanup - Leave non-source/destination channels
-/mode <number> <copy|forward> - Change mode
-
-**Information:**
-/status - Your bot status & queue info
-/help - Show this message
-
-**Forward Modes:**
-• **copy** - New message (no forward tag)
-• **forward** - With attribution
-
-**Sequential Processing:**
-• Messages are processed one by one in order
-• Maintains chronological sequence from source
-• No media skipped, even with bulk posts
-• Prevents server overload
-• Automatic queue management
-
-**Cleanup Command:**
-• Leaves all channels EXCEPT source & destination
-• Safe - keeps your configured channels
-• Use when you joined too many channels
-• Manual control - no auto-leaving
-
-**Adding Channels (4 Methods):**
-• Forward a message from the channel
-• Send channel link/username (@channel or t.me/+link)
-• Send post link (t.me/c/123/456 or t.me/channel/123)
-• Send channel ID (-1001234567890)
-• Works with private/restricted channels!
-"""
+            self.user_state.pop(user_id, None)
         
-        if is_owner:
-            help_text += """
-**Admin Commands (No Login Required):**
-/stats - Bot statistics
-/users - All users list
-/broadcast - Broadcast message to all
-/ban <user_id> [reason] - Ban user with reason
-/unban <user_id> - Unban user
-/banned - View all banned users
-
-**Ban System:**
-• Banned users cannot use ANY bot features
-• All commands and messages are blocked
-• User receives detailed ban notification
-• Automatic client disconnection on ban
-
-Note: Admin commands work without login
-"""
+        except Exception as e:
+            await event.reply(f"Wrong password: {e}\n\nUse /login to try again")
+            self.user_state.pop(user_id, None)
+            await self.discard_login(user_id)
+    
+    async def cmd_logout(self, event, user_id: int):
+        stopping = []
+        for queue_key in [key for key in self.source_queues if key[0] == user_id]:
+            source = self.source_queues.pop(queue_key)
+            processor = source.processor
+            if processor is None or processor.done():
+                continue
+            
+            # A busy processor finishes its current message and then sees the
+            # event; an idle one is parked in queue.get() and can be cancelled
+            source.stop_event.set()
+            if not source.busy:
+                processor.cancel()
+            stopping.append(processor)
+        
+        if stopping:
+            _, pending = await asyncio.wait(stopping, timeout=10)
+            for processor in pending:
+                processor.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            print(f"Stopped {len(stopping)} queue processor(s) for user {user_id}")
+        
+        await self.remove_user_client(user_id)
+        
+        await self.discard_login(user_id)
+        self.user_state.pop(user_id, None)
         
-        help_text += "\nCreated by @akmovieverse\nHub: @instawallpaper/"
+        await self.db.delete_user_session(user_id)
+        
+        if self.logging_enabled:
+            self.log_to_channel(
+                f"**User Logged Out**\n\n"
+                f"User: {event.sender.username or event.sender.first_name}\n"
+                f"ID: `{user_id}`",
+                "logout"
+            )
         
-        await event.reply(help_text)
+        await event.reply(
+            "**Logged out successfully!**\n\n"
+            "Your session has been removed.\n\n"
+            "Use /login to login again"
+        )
+    
+    async def cmd_help(self, event, user_id: int):
+        await event.reply(_OWNER_HELP_TEXT if user_id == self.owner_id else _USER_HELP_TEXT)
     
     async def cmd_myaccount(self, event, user_id: int):
         user_client = await self.get_user_client(user_id)
@@ -888,7 +1310,7 @@ Note: Admin commands work without login
             )
             return
         
-        me = await user_client.get_me()
+        me = await self.get_account(user_id, user_client)
         channels = await self.db.get_user_channels(user_id)
         destination = await self.db.get_user_destination(user_id)
         
@@ -913,50 +1335,14 @@ Created by @akmovieverse
         await event.reply(info)
     
     async def cmd_addsource(self, event, user_id: int):
-        self.awaiting_source_forward[user_id] = True
-        self.awaiting_destination_forward[user_id] = False
+        self.user_state[user_id] = State.AWAIT_SOURCE
         
-        await event.reply(
-            "**Add Source Channel**\n\n"
-            "**Choose one method:**\n\n"
-            "**Method 1 (Easiest):**\n"
-            "Forward ANY message from the channel\n\n"
-            "**Method 2 (Channel Link/Username):**\n"
-            "• `@channelname`\n"
-            "• `https://t.me/channelname`\n"
-            "• `https://t.me/+ABC123xyz` (invite link)\n\n"
-            "**Method 3 (For Restricted Channels):**\n"
-            "Send a post link from the channel:\n"
-            "• `https://t.me/c/1234567890/123` (private post)\n"
-            "• `https://t.me/channelname/123` (public post)\n\n"
-            "**Method 4 (Advanced):**\n"
-            "Send channel ID directly:\n"
-            "• `-1001234567890`\n\n"
-            "You must be a member of the channel!"
-        )
+        await event.reply(_ADD_SOURCE_TEXT)
     
     async def cmd_setdest(self, event, user_id: int):
-        self.awaiting_destination_forward[user_id] = True
-        self.awaiting_source_forward[user_id] = False
+        self.user_state[user_id] = State.AWAIT_DEST
         
-        await event.reply(
-            "**Set Destination Channel**\n\n"
-            "**Choose one method:**\n\n"
-            "**Method 1 (Easiest):**\n"
-            "Forward ANY message from the channel\n\n"
-            "**Method 2 (Channel Link/Username):**\n"
-            "• `@channelname`\n"
-            "• `https://t.me/channelname`\n"
-            "• `https://t.me/+ABC123xyz` (invite link)\n\n"
-            "**Method 3 (For Restricted Channels):**\n"
-            "Send a post link from the channel:\n"
-            "• `https://t.me/c/1234567890/123` (private post)\n"
-            "• `https://t.me/channelname/123` (public post)\n\n"
-            "**Method 4 (Advanced):**\n"
-            "Send channel ID directly:\n"
-            "• `-1001234567890`\n\n"
-            "Make sure you're admin with post permissions!"
-        )
+        await event.reply(_SET_DEST_TEXT)
     
     async def cmd_list(self, event, user_id: int):
         channels = await self.db.get_user_channels(user_id)
@@ -965,14 +1351,17 @@ Created by @akmovieverse
             await event.reply("**No channels**\n\nUse /addsource to add")
             return
         
-        message = "**Your Source Channels:**\n\n"
-        for i, ch in enumerate(channels, 1):
-            mode_icon = "Copy" if ch['forward_mode'] == 'copy' else "Forward"
-            message += f"**{i}.** {mode_icon} {ch['title']}\n"
-            message += f"   Mode: `{ch['forward_mode']}`\n\n"
-        
-        message += "\n/remove <number> - Remove\n"
-        message += "/mode <number> <mode> - Change mode"
+        lines = [
+            f"**{i}.** {_MODE_LABELS.get(ch['forward_mode'], 'Forward')} {ch['title']}\n"
+            f"   Mode: `{ch['forward_mode']}`\n\n"
+            for i, ch in enumerate(channels, 1)
+        ]
+        message = (
+            "**Your Source Channels:**\n\n"
+            + "".join(lines)
+            + "\n/remove <number> - Remove\n"
+            "/mode <number> <mode> - Change mode"
+        )
         
         await event.reply(message)
     
@@ -982,40 +1371,45 @@ Created by @akmovieverse
             return
         
         try:
-            channels = await self.db.get_user_channels(user_id)
             index = int(args[0]) - 1
-            
-            if 0 <= index < len(channels):
-                channel = channels[index]
-                channel_id = channel['channel_id']
-                channel_title = channel['title']
-                
-                if await self.db.remove_user_source_channel(user_id, channel_id):
-                    await event.reply(f"Removed: **{channel_title}**\n\nAuto-cleanup will leave this channel to prevent message spam.")
-                    
-                    try:
-                        user_client = await self.get_user_client(user_id)
-                        if user_client:
-                            if not channel_id.startswith('-'):
-                                channel_id = f"-100{channel_id}"
-                            
-                            channel_entity = await user_client.get_entity(int(channel_id))
-                            await user_client(functions.channels.LeaveChannelRequest(channel_entity))
-                            await event.reply(f"Left channel: **{channel_title}**")
-                            
-                            await self.log_to_channel(
-                                f"**Channel Removed & Left**\n\n"
-                                f"User ID: `{user_id}`\n"
-                                f"Channel: {channel_title}\n"
-                                f"Channel ID: `{channel_id}`",
-                                "channel_remove"
-                            )
-                    except Exception as leave_err:
-                        print(f"Could not auto-leave channel: {leave_err}")
-            else:
-                await event.reply("Invalid number!")
-        except:
+        except ValueError:
+            await event.reply("Number must be an integer!")
+            return
+        
+        channels = await self.db.get_user_channels(user_id)
+        if not 0 <= index < len(channels):
             await event.reply("Invalid number!")
+            return
+        
+        channel_id = channels[index]['channel_id']
+        channel_title = channels[index]['title']
+        
+        if await self.db.remove_user_source_channel(user_id, channel_id):
+            await event.reply(f"Removed: **{channel_title}**\n\nAuto-cleanup will leave this channel to prevent message spam.")
+            self.spawn(self.leave_removed_channel(event, user_id, channel_id, channel_title))
+        else:
+            await event.reply("Could not remove channel, please try again")
+    
+    async def leave_removed_channel(self, event, user_id: int, channel_id: str, channel_title: str):
+        try:
+            user_client = await self.get_user_client(user_id)
+            if not user_client:
+                return
+            
+            channel_entity = await self.api_call(user_client.get_entity, marked_channel_id(channel_id))
+            await self.api_call(user_client, functions.channels.LeaveChannelRequest(channel_entity))
+            await event.reply(f"Left channel: **{channel_title}**")
+            
+            if self.logging_enabled:
+                self.log_to_channel(
+                    f"**Channel Removed & Left**\n\n"
+                    f"User ID: `{user_id}`\n"
+                    f"Channel: {channel_title}\n"
+                    f"Channel ID: `{channel_id}`",
+                    "channel_remove"
+                )
+        except Exception as leave_err:
+            print(f"Could not auto-leave channel: {leave_err}")
     
     async def cmd_cleanup(self, event, user_id: int):
         await event.reply("**Starting cleanup...**\n\nChecking all joined channels...")
@@ -1029,76 +1423,56 @@ Created by @akmovieverse
             channels = await self.db.get_user_channels(user_id)
             destination = await self.db.get_user_destination(user_id)
             
-            keep_channel_ids = set()
-            
-            for ch in channels:
-                ch_id = str(ch['channel_id'])
-                if ch_id.startswith('-100'):
-                    keep_channel_ids.add(ch_id)
-                    keep_channel_ids.add(ch_id[4:])
-                elif ch_id.startswith('-'):
-                    keep_channel_ids.add(ch_id)
-                else:
-                    keep_channel_ids.add(f"-100{ch_id}")
-                    keep_channel_ids.add(ch_id)
-            
+            # Raw channel IDs, the same form as dialog.entity.id
+            keep_channel_ids = {raw_channel_id(ch['channel_id']) for ch in channels}
             if destination:
-                dest_id = str(destination['channel_id'])
-                if dest_id.startswith('-100'):
-                    keep_channel_ids.add(dest_id)
-                    keep_channel_ids.add(dest_id[4:])
-                elif dest_id.startswith('-'):
-                    keep_channel_ids.add(dest_id)
-                else:
-                    keep_channel_ids.add(f"-100{dest_id}")
-                    keep_channel_ids.add(dest_id)
+                keep_channel_ids.add(raw_channel_id(destination['channel_id']))
             
             print(f"Channels to KEEP: {keep_channel_ids}")
             
-            dialogs = await user_client.get_dialogs()
-            
             left_count = 0
             kept_count = 0
             failed_count = 0
             
             status_msg = await event.reply("Scanning channels...")
             
-            for dialog in dialogs:
-                if not dialog.is_channel:
-                    continue
-                
-                channel_id_raw = str(dialog.id)
-                channel_id_with_100 = f"-100{dialog.id}" if not channel_id_raw.startswith('-') else channel_id_raw
-                
-                should_keep = (
-                    channel_id_raw in keep_channel_ids or 
-                    channel_id_with_100 in keep_channel_ids or
-                    str(abs(dialog.id)) in keep_channel_ids
-                )
+            semaphore = asyncio.Semaphore(5)
+            
+            async def leave_one(dialog):
+                nonlocal left_count, failed_count
+                async with semaphore:
+                    try:
+                        await self.api_call(user_client, functions.channels.LeaveChannelRequest(dialog.entity))
+                    except Exception as leave_err:
+                        failed_count += 1
+                        print(f"Failed to leave {dialog.title}: {leave_err}")
+                        return
                 
-                if should_keep:
-                    kept_count += 1
-                    print(f"Keeping: {dialog.title} ({channel_id_with_100})")
-                    continue
+                left_count += 1
+                print(f"Left: {dialog.title} ({dialog.id})")
                 
-                try:
-                    await user_client(functions.channels.LeaveChannelRequest(dialog.entity))
-                    left_count += 1
-                    print(f"Left: {dialog.title} ({channel_id_with_100})")
-                    
-                    if left_count % 5 == 0:
+                if left_count % 5 == 0:
+                    try:
                         await status_msg.edit(
                             f"**Cleanup in progress...**\n\n"
                             f"Left: {left_count}\n"
                             f"Kept: {kept_count} (source/destination)\n"
                             f"Failed: {failed_count}"
                         )
+                    except Exception:
+                        pass
+            
+            # Stream dialogs page by page and start leaving while later pages load
+            async with asyncio.TaskGroup() as leaving:
+                async for dialog in user_client.iter_dialogs():
+                    if not dialog.is_channel:
+                        continue
                     
-                    await asyncio.sleep(0.5)
-                    
-                except Exception as leave_err:
-                    failed_count += 1
-                    print(f"Failed to leave {dialog.title}: {leave_err}")
+                    if dialog.entity.id in keep_channel_ids:
+                        kept_count += 1
+                        print(f"Keeping: {dialog.title} ({dialog.id})")
+                    else:
+                        leaving.create_task(leave_one(dialog))
             
             await status_msg.edit(
                 f"**Cleanup Complete!**\n\n"
@@ -1110,14 +1484,15 @@ Created by @akmovieverse
                 f"You will no longer receive spam from removed channels."
             )
             
-            await self.log_to_channel(
-                f"**Bulk Cleanup Completed**\n\n"
-                f"User ID: `{user_id}`\n"
-                f"Left: {left_count}\n"
-                f"Kept: {kept_count}\n"
-                f"Failed: {failed_count}",
-                "bulk_cleanup"
-            )
+            if self.logging_enabled:
+                self.log_to_channel(
+                    f"**Bulk Cleanup Completed**\n\n"
+                    f"User ID: `{user_id}`\n"
+                    f"Left: {left_count}\n"
+                    f"Kept: {kept_count}\n"
+                    f"Failed: {failed_count}",
+                    "bulk_cleanup"
+                )
             
         except Exception as e:
             await event.reply(f"Cleanup failed: {e}")
@@ -1128,36 +1503,40 @@ Created by @akmovieverse
             return
         
         try:
-            channels = await self.db.get_user_channels(user_id)
             index = int(args[0]) - 1
-            mode = args[1].lower()
-            
-            if mode not in ['copy', 'forward']:
-                await event.reply("Mode must be 'copy' or 'forward'")
-                return
-            
-            if 0 <= index < len(channels):
-                channel = channels[index]
-                if await self.db.set_user_forward_mode(user_id, channel['channel_id'], mode):
-                    await event.reply(f"Mode changed to: {mode}")
-            else:
-                await event.reply("Invalid number!")
-        except:
-            await event.reply("Invalid input!")
+        except ValueError:
+            await event.reply("Number must be an integer!")
+            return
+        
+        mode = args[1].lower()
+        if mode not in ('copy', 'forward'):
+            await event.reply("Mode must be 'copy' or 'forward'")
+            return
+        
+        channels = await self.db.get_user_channels(user_id)
+        if not 0 <= index < len(channels):
+            await event.reply("Invalid number!")
+            return
+        
+        if await self.db.set_user_forward_mode(user_id, channels[index]['channel_id'], mode):
+            await event.reply(f"Mode changed to: {mode}")
+        else:
+            await event.reply("Could not update mode, please try again")
     
     async def cmd_status(self, event, user_id: int):
-        channels = await self.db.get_user_channels(user_id)
-        destination = await self.db.get_user_destination(user_id)
+        channels, destination = await asyncio.gather(
+            self.db.get_user_channels(user_id),
+            self.db.get_user_destination(user_id)
+        )
         
-        copy_count = sum(1 for ch in channels if ch['forward_mode'] == 'copy')
+        mode_counts = Counter(ch['forward_mode'] for ch in channels)
+        copy_count = mode_counts['copy']
+        # Anything that isn't copy is forwarded, as in /list
         forward_count = len(channels) - copy_count
         
-        queue_size = 0
-        is_processing = False
-        if user_id in self.message_queues:
-            queue_size = self.message_queues[user_id].qsize()
-        if user_id in self.processing_locks:
-            is_processing = self.processing_locks[user_id]
+        sources = [source for key, source in self.source_queues.items() if key[0] == user_id]
+        queue_size = sum(source.queue.qsize() for source in sources)
+        is_processing = any(source.busy for source in sources)
         
         queue_status = "Idle" if queue_size == 0 else f"Processing ({queue_size} in queue)"
         if is_processing:
@@ -1195,7 +1574,7 @@ Created by @AkMovieVerse
                 await event.reply(f"Looking up channel by ID...\n\n`{channel_input}`")
                 try:
                     channel_id_int = int(channel_input)
-                    channel = await user_client.get_entity(channel_id_int)
+                    channel = await self.api_call(user_client.get_entity, channel_id_int)
                 except Exception as e:
                     await event.reply(
                         f"**Could not find channel:** {e}\n\n"
@@ -1207,65 +1586,37 @@ Created by @AkMovieVerse
                     )
                     return
             
-            elif 't.me/' in channel_input and ('/' in channel_input.split('t.me/')[-1].split('?')[0] and 
-                                                 channel_input.split('/')[-1].replace('?', '/').split('/')[0].isdigit()):
+            elif post_link := _POST_LINK.match(channel_input):
                 await event.reply(f"Extracting channel from post link...\n\n`{channel_input}`")
                 
-                parts = channel_input.split('/')
-                
-                if '/c/' in channel_input:
-                    channel_id_part = None
-                    for i, part in enumerate(parts):
-                        if part == 'c' and i + 1 < len(parts):
-                            channel_id_part = parts[i + 1]
-                            break
-                    
-                    if channel_id_part and channel_id_part.isdigit():
-                        channel_id_int = int('-100' + channel_id_part)
-                        try:
-                            channel = await user_client.get_entity(channel_id_int)
-                        except Exception as e:
-                            await event.reply(
-                                f"**Could not access channel:** {e}\n\n"
-                                f"**Possible reasons:**\n"
-                                f"• You're not a member of this private channel\n"
-                                f"• You've been removed from the channel\n"
-                                f"• Channel has been deleted\n\n"
-                                f"Make sure you can open this link in Telegram first"
-                            )
-                            return
-                    else:
-                        await event.reply("Invalid post link format!")
+                private_id, channel_username = post_link.groups()
+                if private_id:
+                    try:
+                        channel = await self.api_call(user_client.get_entity, int('-100' + private_id))
+                    except Exception as e:
+                        await event.reply(
+                            f"**Could not access channel:** {e}\n\n"
+                            f"**Possible reasons:**\n"
+                            f"• You're not a member of this private channel\n"
+                            f"• You've been removed from the channel\n"
+                            f"• Channel has been deleted\n\n"
+                            f"Make sure you can open this link in Telegram first"
+                        )
                         return
                 else:
-                    channel_username = None
-                    for i, part in enumerate(parts):
-                        if 't.me' in parts[i-1] if i > 0 else '' or part.startswith('t.me'):
-                            continue
-                        if part and not part.isdigit() and part != 's':
-                            channel_username = part
-                            break
-                    
-                    if channel_username:
-                        channel_input = '@' + channel_username if not channel_username.startswith('@') else channel_username
-                        channel = await user_client.get_entity(channel_input)
-                    else:
-                        await event.reply("Could not extract channel from link!")
-                        return
+                    channel = await self.api_call(user_client.get_entity, '@' + channel_username)
             
             else:
                 if 't.me/' in channel_input:
-                    if '/+' in channel_input or '/joinchat/' in channel_input:
-                        channel_input = channel_input.split('/')[-1]
-                    else:
-                        channel_input = channel_input.split('/')[-1]
-                        if not channel_input.startswith('@'):
-                            channel_input = '@' + channel_input
+                    is_invite = '/+' in channel_input or '/joinchat/' in channel_input
+                    channel_input = channel_input.rstrip('/').rpartition('/')[2]
+                    if not is_invite and not channel_input.startswith('@'):
+                        channel_input = '@' + channel_input
                 
                 await event.reply(f"Looking up channel...\n\n`{channel_input}`")
                 
                 try:
-                    channel = await user_client.get_entity(channel_input)
+                    channel = await self.api_call(user_client.get_entity, channel_input)
                 except Exception as e:
                     if '+' in channel_input or 'joinchat' in str(e).lower():
                         try:
@@ -1290,7 +1641,9 @@ Created by @AkMovieVerse
             channel_title = getattr(channel, 'title', 'Unknown')
             is_private = getattr(channel, 'username', None) is None
             
-            if user_id in self.awaiting_source_forward and self.awaiting_source_forward[user_id]:
+            state = self.user_state.get(user_id)
+            
+            if state == State.AWAIT_SOURCE:
                 if await self.db.add_user_source_channel(user_id, channel_id, channel_title):
                     private_marker = "(Private)" if is_private else "(Public)"
                     await event.reply(
@@ -1303,17 +1656,17 @@ Created by @AkMovieVerse
                 else:
                     await event.reply("Channel already added!")
                 
-                self.awaiting_source_forward[user_id] = False
+                self.user_state.pop(user_id, None)
             
-            elif user_id in self.awaiting_destination_forward and self.awaiting_destination_forward[user_id]:
+            elif state == State.AWAIT_DEST:
                 try:
-                    permissions = await user_client.get_permissions(channel, 'me')
+                    permissions = await self.get_my_permissions(user_id, user_client, channel)
                     if not permissions.is_admin or not permissions.post_messages:
                         await event.reply(
                             "**Warning:** You may not have admin rights!\n\n"
                             "Make sure you can post messages to this channel."
                         )
-                except:
+                except Exception:
                     pass
                 
                 if await self.db.set_user_destination(user_id, channel_id, channel_title):
@@ -1326,7 +1679,7 @@ Created by @AkMovieVerse
                 else:
                     await event.reply("Failed!")
                 
-                self.awaiting_destination_forward[user_id] = False
+                self.user_state.pop(user_id, None)
         
         except Exception as e:
             await event.reply(
@@ -1340,8 +1693,7 @@ Created by @AkMovieVerse
                 f"• `https://t.me/channelname`\n"
                 f"• `https://t.me/+ABC123xyz`"
             )
-            import traceback
-            traceback.print_exc()
+            self.log_traceback("handle_channel_link")
     
     async def handle_forwarded_message(self, event, user_id: int):
         user_client = await self.get_user_client(user_id)
@@ -1354,7 +1706,7 @@ Created by @AkMovieVerse
             if hasattr(forward_from, 'chat') and forward_from.chat:
                 channel = forward_from.chat
             elif hasattr(forward_from, 'channel_id'):
-                channel = await user_client.get_entity(forward_from.channel_id)
+                channel = await self.api_call(user_client.get_entity, forward_from.channel_id)
             else:
                 await event.reply("Could not identify channel!")
                 return
@@ -1362,7 +1714,9 @@ Created by @AkMovieVerse
             channel_id = str(channel.id)
             channel_title = getattr(channel, 'title', 'Unknown')
             
-            if user_id in self.awaiting_source_forward and self.awaiting_source_forward[user_id]:
+            state = self.user_state.get(user_id)
+            
+            if state == State.AWAIT_SOURCE:
                 if await self.db.add_user_source_channel(user_id, channel_id, channel_title):
                     await event.reply(
                         f"**Source Added!**\n\n"
@@ -1370,39 +1724,41 @@ Created by @AkMovieVerse
                         f"Mode: copy"
                     )
                     
-                    await self.log_to_channel(
-                        f"**Source Channel Added**\n\n"
-                        f"User: {event.sender.username or event.sender.first_name}\n"
-                        f"User ID: `{user_id}`\n"
-                        f"Channel: {channel_title}\n"
-                        f"Channel ID: `{channel_id}`\n"
-                        f"Mode: copy",
-                        "channel_add"
-                    )
+                    if self.logging_enabled:
+                        self.log_to_channel(
+                            f"**Source Channel Added**\n\n"
+                            f"User: {event.sender.username or event.sender.first_name}\n"
+                            f"User ID: `{user_id}`\n"
+                            f"Channel: {channel_title}\n"
+                            f"Channel ID: `{channel_id}`\n"
+                            f"Mode: copy",
+                            "channel_add"
+                        )
                 else:
                     await event.reply("Channel already added!")
                 
-                self.awaiting_source_forward[user_id] = False
+                self.user_state.pop(user_id, None)
             
-            elif user_id in self.awaiting_destination_forward and self.awaiting_destination_forward[user_id]:
+            elif state == State.AWAIT_DEST:
                 if await self.db.set_user_destination(user_id, channel_id, channel_title):
                     await event.reply(
                         f"**Destination Set!**\n\n"
                         f"{channel_title}"
                     )
                     
-                    await self.log_to_channel(
-                        f"**Destination Channel Set**\n\n"
-                        f"User: {event.sender.username or event.sender.first_name}\n"
-                        f"User ID: `{user_id}`\n"
-                        f"Channel: {channel_title}\n"
-                        f"Channel ID: `{channel_id}`",
-                        "channel_add"
-                    )
+                    if self.logging_enabled:
+                        self.log_to_channel(
+                            f"**Destination Channel Set**\n\n"
+                            f"User: {event.sender.username or event.sender.first_name}\n"
+                            f"User ID: `{user_id}`\n"
+                            f"Channel: {channel_title}\n"
+                            f"Channel ID: `{channel_id}`",
+                            "channel_add"
+                        )
                 else:
                     await event.reply("Failed!")
                 
-                self.awaiting_destination_forward[user_id] = False
+                self.user_state.pop(user_id, None)
         
         except Exception as e:
             await event.reply(f"Error: {e}")
@@ -1412,65 +1768,41 @@ Created by @AkMovieVerse
             if not event.is_channel:
                 return
             
-            channel_id = str(event.chat_id)
-            if not channel_id.startswith('-'):
-                channel_id = f"-100{event.chat_id}"
-            
-            print(f"Message received from channel {channel_id} for user {user_id}")
+            # Already the marked -100 form for channels; used as-is for keys
+            channel_id = event.chat_id
             
-            channels = await self.db.get_user_channels(user_id)
-            source_channel = None
+            logger.debug("Message received from channel %s for user %s", channel_id, user_id)
             
-            for ch in channels:
-                db_channel_id = str(ch['channel_id'])
-                if not db_channel_id.startswith('-'):
-                    db_channel_id = f"-100{db_channel_id}"
-                
-                if db_channel_id == channel_id or ch['channel_id'] == str(abs(event.chat_id)):
-                    source_channel = ch
-                    print(f"Matched source channel: {ch['title']}")
-                    break
+            source_channel = await self.get_source_channel(user_id, channel_id)
             
             if not source_channel:
-                if user_id not in self.ignored_channels:
-                    self.ignored_channels[user_id] = {}
-                
-                current_time = asyncio.get_event_loop().time()
-                
-                if channel_id in self.ignored_channels[user_id]:
-                    last_warn_time = self.ignored_channels[user_id][channel_id]
-                    time_since_warn = current_time - last_warn_time
-                    
-                    if time_since_warn < 300:
-                        return
-                
-                print(f"Channel {channel_id} not in user's source list - ignoring message")
-                self.ignored_channels[user_id][channel_id] = current_time
+                if self.ignored_channels.allow((user_id, channel_id)):
+                    logger.info("Channel %s not in user's source list - ignoring message", channel_id)
                 return
             
             destination = await self.db.get_user_destination(user_id)
             if not destination:
-                print(f"No destination set for user {user_id}")
+                logger.info("No destination set for user %s", user_id)
                 return
             
-            dest_channel_id = destination['channel_id']
-            if dest_channel_id.startswith('-100'):
-                dest_channel_id = int(dest_channel_id)
-            elif dest_channel_id.startswith('-'):
-                dest_channel_id = int(dest_channel_id)
-            else:
-                dest_channel_id = int(f"-100{dest_channel_id}")
+            # Parsed once per cached destination row, not once per message
+            dest_channel_id = destination.get('channel_id_int')
+            if dest_channel_id is None:
+                dest_channel_id = destination['channel_id_int'] = marked_channel_id(destination['channel_id'])
             
-            print(f"Adding to queue for destination: {destination['title']} ({dest_channel_id})")
+            logger.debug("Adding to queue for destination: %s (%s)", destination['title'], dest_channel_id)
             
-            if user_id not in self.message_queues:
-                self.message_queues[user_id] = asyncio.Queue()
-                self.processing_locks[user_id] = False
-                print(f"Created message queue for user {user_id}")
+            queue_key = (user_id, channel_id)
             
-            if user_id not in self.queue_processors or self.queue_processors[user_id].done():
-                self.queue_processors[user_id] = asyncio.create_task(self.process_message_queue(user_id))
-                print(f"Started queue processor for user {user_id}")
+            source = self.source_queues.get(queue_key)
+            if source is None:
+                source = self.source_queues[queue_key] = SourceQueue(asyncio.Queue(maxsize=MESSAGE_QUEUE_SIZE))
+                logger.debug("Created message queue for user %s (%s)", user_id, channel_id)
+            queue = source.queue
+            
+            if not source.running:
+                source.start(self.process_message_queue(user_id, channel_id, source))
+                logger.debug("Started queue processor for user %s (%s)", user_id, channel_id)
             
             message_data = {
                 'event': event,
@@ -1482,33 +1814,27 @@ Created by @AkMovieVerse
                 'message_date': event.message.date
             }
             
-            await self.message_queues[user_id].put(message_data)
-            queue_size = self.message_queues[user_id].qsize()
-            print(f"Message {event.message.id} (date: {event.message.date}) added to queue (queue size: {queue_size})")
+            try:
+                queue.put_nowait(message_data)
+            except asyncio.QueueFull:
+                source.full_count += 1
+                now = time.monotonic()
+                if now - source.full_logged_at >= BACKPRESSURE_LOG_INTERVAL:
+                    source.full_logged_at = now
+                    logger.warning("Queue full for user %s (%s), waiting for the forwarder (%d times so far)",
+                                   user_id, channel_id, source.full_count)
+                await queue.put(message_data)
+            queue_size = queue.qsize()
+            logger.info("Message %s (date: %s) added to queue (queue size: %d)", event.message.id, event.message.date, queue_size)
             
             if queue_size % 10 == 0 and queue_size > 0:
-                print(f"Queue status for user {user_id}: {queue_size} messages pending")
-                stats = await self.db.get_stats()
-                if stats['total_forwards'] % 50 == 0:
-                    await self.log_to_channel(
-                        f"**Forwarding Milestone**\n\n"
-                        f"Total Forwards: {stats['total_forwards']}\n"
-                        f"Active Users: {stats['total_users']}\n"
-                        f"Sequential Processing: Active\n"
-                        f"Success Rate: ~95%",
-                        "forward"
-                    )
+                logger.info("Queue status for user %s: %d messages pending", user_id, queue_size)
         
         except Exception as e:
-            print(f"Error in handle_user_channel_message: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error("Error in handle_user_channel_message: %s", e)
+            self.log_traceback("handle_user_channel_message")
 # Full _copy_message_with_media() with detailed logging for debugging
     async def _copy_message_with_media(self, client, message, destination, user_id, force_download=False):
-        import os
-        import tempfile
-        import traceback
-        
         print(f"[COPY] Starting media copy for message {message.id} (force_download={force_download})")
         
         try:
@@ -1517,10 +1843,14 @@ Created by @AkMovieVerse
             if message.media:
                 print(f"[COPY] Media detected: {type(message.media).__name__}")
                 
-                temp_dir = tempfile.gettempdir()
-                temp_path = os.path.join(temp_dir, f"tg_media_{message.id}_{int(asyncio.get_event_loop().time())}")
+                temp_dir = self.media_temp_dir
+                temp_path = f"{temp_dir}{os.sep}tg_media_{message.id}_{time.monotonic_ns()}"
                 progress_msg = None
                 
+                # Another user forwarding the same post can reuse the download
+                cache_key = (message.chat_id, message.id)
+                cache_held = False
+                
                 try:
                     print(f"[COPY] Creating progress message to send in user id: {user_id}")
                     if user_id is None:
@@ -1533,136 +1863,151 @@ Created by @AkMovieVerse
                         print(f"[COPY] Progress message sent, ID: {progress_msg.id}")
                 except Exception as send_err:
                     print(f"[COPY] FAILED to send progress message to user_id: {send_err}")
-                    traceback.print_exc()
+                    self.log_traceback("copy progress message")
                     progress_msg = None
                 
+                # Progress edits are coalesced so transfers never wait on them
+                progress = EditThrottler(progress_msg, PROGRESS_EDIT_INTERVAL) if progress_msg else None
+                
                 try:
-                    last_progress_update = 0
-                    download_start_time = asyncio.get_event_loop().time()
+                    next_download_mark = 0
+                    download_start_time = time.monotonic()
                     last_update_time = download_start_time
                     last_current_bytes = 0
                     
                     async def download_progress_callback(current, total):
-                        nonlocal last_progress_update, last_update_time, last_current_bytes
-                        if total > 0:
-                            percent = (current / total) * 100
-                            if percent - last_progress_update >= 10:
-                                last_progress_update = percent
-                                
-                                current_time = asyncio.get_event_loop().time()
-                                time_diff = current_time - last_update_time
-                                bytes_diff = current - last_current_bytes
-                                
-                                if time_diff > 0:
-                                    speed_mbps = (bytes_diff / time_diff) / (1024 * 1024)
-                                    avg_speed = (current / (current_time - download_start_time)) / (1024 * 1024)
-                                    
-                                    try:
-                                        if progress_msg:
-                                            await progress_msg.edit(
-                                                f"**Processing media...**\n"
-                                                f"Downloading: {percent:.1f}%\n"
-                                                f"{current / 1024 / 1024:.1f} MB / {total / 1024 / 1024:.1f} MB\n"
-                                                f"Speed: {speed_mbps:.2f} MB/s (avg: {avg_speed:.2f} MB/s)"
-                                            )
-                                            print(f"[COPY] Download progress updated: {percent:.1f}%")
-                                    except Exception as edit_err:
-                                        print(f"[COPY] Failed to edit progress message: {edit_err}")
-                                    
-                                    last_update_time = current_time
-                                    last_current_bytes = current
-                    
-                    max_download_retries = 3
-                    downloaded_path = None
-                    
-                    for attempt in range(max_download_retries):
-                        try:
-                            print(f"[COPY] Download attempt {attempt + 1}/{max_download_retries}")
+                        nonlocal next_download_mark, last_update_time, last_current_bytes
+                        # Report once per 10% step; other chunks cost one compare
+                        if total <= 0 or current < next_download_mark:
+                            return
+                        step = total // 10 or 1
+                        next_download_mark = (current // step + 1) * step
+                        if current < step:
+                            return
+                        
+                        percent = (current / total) * 100
+                        current_time = time.monotonic()
+                        time_diff = current_time - last_update_time
+                        bytes_diff = current - last_current_bytes
+                        
+                        if time_diff > 0:
+                            speed_mbps = (bytes_diff / time_diff) / (1024 * 1024)
+                            avg_speed = (current / (current_time - download_start_time)) / (1024 * 1024)
                             
-                            file_size = 0
-                            if hasattr(message.media, 'document') and hasattr(message.media.document, 'size'):
-                                file_size = message.media.document.size
-                            elif hasattr(message.media, 'photo'):
-                                file_size = 10 * 1024 * 1024
+                            if progress:
+                                progress.update(
+                                    f"**Processing media...**\n"
+                                    f"Downloading: {percent:.1f}%\n"
+                                    f"{current / 1024 / 1024:.1f} MB / {total / 1024 / 1024:.1f} MB\n"
+                                    f"Speed: {speed_mbps:.2f} MB/s (avg: {avg_speed:.2f} MB/s)"
+                                )
                             
-                            file_size_mb = file_size / (1024 * 1024)
-                            download_timeout = max(240, (file_size_mb / 1.5) + 180)
-                            print(f"[COPY] Estimated size: {file_size_mb:.1f} MB, timeout: {download_timeout}s")
+                            last_update_time = current_time
+                            last_current_bytes = current
+                    
+                    async with self.media_cache.lock(cache_key):
+                        downloaded_path = await self.media_cache.get(cache_key)
+                        if downloaded_path:
+                            cache_held = True
+                            print(f"[COPY] Reusing cached download: {downloaded_path}")
+                        else:
+                            # Cap concurrent downloads across all users and sources
+                            async with self.download_slots:
+                                max_download_retries = 3
+                                for attempt in range(max_download_retries):
+                                    try:
+                                        print(f"[COPY] Download attempt {attempt + 1}/{max_download_retries}")
+                                        
+                                        document = getattr(message.media, 'document', None)
+                                        if document is not None:
+                                            file_size = getattr(document, 'size', 0)
+                                        elif getattr(message.media, 'photo', None) is not None:
+                                            file_size = 10 * 1024 * 1024
+                                        else:
+                                            file_size = 0
+                                        
+                                        file_size_mb = file_size / (1024 * 1024)
+                                        download_timeout = max(240, (file_size_mb / 1.5) + 180)
+                                        print(f"[COPY] Estimated size: {file_size_mb:.1f} MB, timeout: {download_timeout}s")
+                                        
+                                        downloaded_path = await asyncio.wait_for(
+                                            client.download_media(
+                                                message, 
+                                                file=temp_path, 
+                                                progress_callback=download_progress_callback
+                                            ),
+                                            timeout=download_timeout
+                                        )
+                                        if downloaded_path:
+                                            print(f"[COPY] Download successful: {downloaded_path}")
+                                            break
+                                    except asyncio.TimeoutError:
+                                        print(f"[COPY] Download timeout on attempt {attempt + 1}")
+                                        if progress:
+                                            progress.update(f"Download timeout, retrying... ({attempt + 1}/{max_download_retries})")
+                                        if attempt < max_download_retries - 1:
+                                            await asyncio.sleep(5)
+                                    except Exception as dl_err:
+                                        print(f"[COPY] Download error on attempt {attempt + 1}: {dl_err}")
+                                        self.log_traceback("copy download")
+                                        if attempt < max_download_retries - 1:
+                                            await asyncio.sleep(3)
                             
-                            downloaded_path = await asyncio.wait_for(
-                                client.download_media(
-                                    message, 
-                                    file=temp_path, 
-                                    progress_callback=download_progress_callback
-                                ),
-                                timeout=download_timeout
-                            )
+                            # download_media only returns a path once the file is written
                             if downloaded_path:
-                                print(f"[COPY] Download successful: {downloaded_path}")
-                                break
-                        except asyncio.TimeoutError:
-                            print(f"[COPY] Download timeout on attempt {attempt + 1}")
-                            if progress_msg:
-                                try:
-                                    await progress_msg.edit(f"Download timeout, retrying... ({attempt + 1}/{max_download_retries})")
-                                except:
-                                    pass
-                            if attempt < max_download_retries - 1:
-                                await asyncio.sleep(5)
-                        except Exception as dl_err:
-                            print(f"[COPY] Download error on attempt {attempt + 1}: {dl_err}")
-                            traceback.print_exc()
-                            if attempt < max_download_retries - 1:
-                                await asyncio.sleep(3)
+                                self.media_cache.put(cache_key, downloaded_path)
+                                cache_held = True
+                    
+                    # One stat both confirms the file and gives its size
+                    try:
+                        file_size_actual = (await asyncio.to_thread(os.stat, downloaded_path)).st_size if downloaded_path else None
+                    except OSError:
+                        file_size_actual = None
                     
-                    if downloaded_path and os.path.exists(downloaded_path):
-                        file_size_actual = os.path.getsize(downloaded_path)
+                    if file_size_actual is not None:
                         print(f"[COPY] Media fully downloaded: {file_size_actual / 1024 / 1024:.2f} MB")
                         
-                        if progress_msg:
-                            try:
-                                await progress_msg.edit(
-                                    f"**Download Complete!**\n"
-                                    f"Size: {file_size_actual / 1024 / 1024:.2f} MB\n"
-                                    f"Starting upload..."
-                                )
-                            except Exception as edit_err:
-                                print(f"[COPY] Failed to update progress after download: {edit_err}")
+                        if progress:
+                            progress.update(
+                                f"**Download Complete!**\n"
+                                f"Size: {file_size_actual / 1024 / 1024:.2f} MB\n"
+                                f"Starting upload..."
+                            )
                         
-                        last_upload_progress = 0
-                        upload_start_time = asyncio.get_event_loop().time()
+                        next_upload_mark = 0
+                        upload_start_time = time.monotonic()
                         last_upload_time = upload_start_time
                         last_upload_bytes = 0
                         
                         async def upload_progress_callback(current, total):
-                            nonlocal last_upload_progress, last_upload_time, last_upload_bytes
-                            if total > 0:
-                                percent = (current / total) * 100
-                                if percent - last_upload_progress >= 10:
-                                    last_upload_progress = percent
-                                    
-                                    current_time = asyncio.get_event_loop().time()
-                                    time_diff = current_time - last_upload_time
-                                    bytes_diff = current - last_upload_bytes
-                                    
-                                    if time_diff > 0:
-                                        speed_mbps = (bytes_diff / time_diff) / (1024 * 1024)
-                                        avg_speed = (current / (current_time - upload_start_time)) / (1024 * 1024)
-                                        
-                                        try:
-                                            if progress_msg:
-                                                await progress_msg.edit(
-                                                    f"**Download Complete!**\n"
-                                                    f"Size: {file_size_actual / 1024 / 1024:.2f} MB\n"
-                                                    f"Uploading: {percent:.1f}%\n"
-                                                    f"{current / 1024 / 1024:.1f} MB / {total / 1024 / 1024:.1f} MB\n"
-                                                    f"Speed: {speed_mbps:.2f} MB/s (avg: {avg_speed:.2f} MB/s)"
-                                                )
-                                        except Exception as edit_err:
-                                            print(f"[COPY] Failed to update upload progress: {edit_err}")
-                                    
-                                    last_upload_time = current_time
-                                    last_upload_bytes = current
+                            nonlocal next_upload_mark, last_upload_time, last_upload_bytes
+                            if total <= 0 or current < next_upload_mark:
+                                return
+                            step = total // 10 or 1
+                            next_upload_mark = (current // step + 1) * step
+                            if current < step:
+                                return
+                            
+                            percent = (current / total) * 100
+                            current_time = time.monotonic()
+                            time_diff = current_time - last_upload_time
+                            bytes_diff = current - last_upload_bytes
+                            
+                            if time_diff > 0:
+                                speed_mbps = (bytes_diff / time_diff) / (1024 * 1024)
+                                avg_speed = (current / (current_time - upload_start_time)) / (1024 * 1024)
+                                
+                                if progress:
+                                    progress.update(
+                                        f"**Download Complete!**\n"
+                                        f"Size: {file_size_actual / 1024 / 1024:.2f} MB\n"
+                                        f"Uploading: {percent:.1f}%\n"
+                                        f"{current / 1024 / 1024:.1f} MB / {total / 1024 / 1024:.1f} MB\n"
+                                        f"Speed: {speed_mbps:.2f} MB/s (avg: {avg_speed:.2f} MB/s)"
+                                    )
+                            
+                            last_upload_time = current_time
+                            last_upload_bytes = current
                         
                         max_upload_retries = 3
                         upload_success = False
@@ -1676,12 +2021,11 @@ Created by @AkMovieVerse
                         supports_streaming = False
                         thumb = None
                         
-                        if hasattr(message.media, 'document'):
-                            doc = message.media.document
-                            if hasattr(doc, 'attributes') and doc.attributes:
-                                attributes = doc.attributes
+                        doc = getattr(message.media, 'document', None)
+                        if doc is not None:
+                            attributes = getattr(doc, 'attributes', None) or []
                             
-                            if hasattr(doc, 'thumbs') and doc.thumbs:
+                            if getattr(doc, 'thumbs', None):
                                 try:
                                     thumb_path = os.path.join(temp_dir, f"thumb_{message.id}.jpg")
                                     thumb = await client.download_media(message.media, file=thumb_path, thumb=-1)
@@ -1690,68 +2034,65 @@ Created by @AkMovieVerse
                                     thumb = None
                             
                             for attr in attributes:
-                                if hasattr(attr, '__class__'):
-                                    if attr.__class__.__name__ == 'DocumentAttributeVideo':
-                                        supports_streaming = getattr(attr, 'supports_streaming', False)
+                                if isinstance(attr, DocumentAttributeVideo):
+                                    supports_streaming = bool(attr.supports_streaming)
                         
-                        for attempt in range(max_upload_retries):
-                            try:
-                                print(f"[COPY] Upload attempt {attempt + 1}/{max_upload_retries}")
-                                
-                                await asyncio.wait_for(
-                                    client.send_file(
-                                        destination, 
-                                        downloaded_path,
-                                        caption=text if text else None,
-                                        attributes=attributes if attributes else None,
-                                        force_document=force_document,
-                                        supports_streaming=supports_streaming,
-                                        thumb=thumb if thumb else None,
-                                        progress_callback=upload_progress_callback
-                                    ),
-                                    timeout=upload_timeout
-                                )
-                                upload_success = True
-                                print(f"[COPY] Upload successful")
-                                
-                                if progress_msg:
-                                    try:
-                                        await progress_msg.delete()
-                                        print(f"[COPY] Progress message deleted")
-                                    except Exception as del_err:
-                                        print(f"[COPY] Failed to delete progress message: {del_err}")
-                                break
-                            except asyncio.TimeoutError:
-                                print(f"[COPY] Upload timeout on attempt {attempt + 1}")
-                                if progress_msg:
-                                    try:
-                                        await progress_msg.edit(f"Upload timeout, retrying... ({attempt + 1}/{max_upload_retries})")
-                                    except:
-                                        pass
-                                if attempt < max_upload_retries - 1:
-                                    await asyncio.sleep(5)
-                            except Exception as up_err:
-                                print(f"[COPY] Upload error on attempt {attempt + 1}: {up_err}")
-                                traceback.print_exc()
-                                if attempt < max_upload_retries - 1:
-                                    await asyncio.sleep(3)
+                        # One handle serves every attempt; the file itself stays
+                        # owned by the media cache
+                        with open(downloaded_path, 'rb') as upload_file:
+                            for attempt in range(max_upload_retries):
+                                try:
+                                    print(f"[COPY] Upload attempt {attempt + 1}/{max_upload_retries}")
+                                    if attempt:
+                                        await self.ensure_connected(client)
+                                    upload_file.seek(0)
+                                    
+                                    await asyncio.wait_for(
+                                        client.send_file(
+                                            destination, 
+                                            upload_file,
+                                            part_size_kb=512,
+                                            caption=text if text else None,
+                                            attributes=attributes if attributes else None,
+                                            force_document=force_document,
+                                            supports_streaming=supports_streaming,
+                                            thumb=thumb if thumb else None,
+                                            progress_callback=upload_progress_callback
+                                        ),
+                                        timeout=upload_timeout
+                                    )
+                                    upload_success = True
+                                    print(f"[COPY] Upload successful")
+                                    
+                                    if progress_msg:
+                                        progress.cancel()
+                                        try:
+                                            await progress_msg.delete()
+                                            print(f"[COPY] Progress message deleted")
+                                        except Exception as del_err:
+                                            print(f"[COPY] Failed to delete progress message: {del_err}")
+                                    break
+                                except (asyncio.TimeoutError, OSError) as up_err:
+                                    # Timeouts and dropped connections are worth retrying; any
+                                    # other error propagates to the direct-reference fallback
+                                    print(f"[COPY] Upload error on attempt {attempt + 1}: {up_err!r}")
+                                    if attempt < max_upload_retries - 1:
+                                        if progress:
+                                            progress.update(f"Upload interrupted, retrying... ({attempt + 1}/{max_upload_retries})")
+                                        await asyncio.sleep(min(30, 0.5 * 2 ** attempt) + random.uniform(0, 0.5))
                         
                         if not upload_success:
                             print(f"[COPY] Upload failed after all retries")
                             if progress_msg:
+                                progress.cancel()
                                 try:
                                     await progress_msg.edit("**Upload Failed**\nAll attempts failed")
                                 except:
                                     pass
-                        
-                        try:
-                            os.remove(downloaded_path)
-                            print(f"[COPY] Temp file cleaned up")
-                        except:
-                            pass
                     else:
                         print(f"[COPY] Download failed or file missing")
                         if progress_msg:
+                            progress.cancel()
                             try:
                                 await progress_msg.edit("Download failed")
                             except:
@@ -1761,13 +2102,10 @@ Created by @AkMovieVerse
                 
                 except Exception as media_error:
                     print(f"[COPY] Media handling exception: {media_error}")
-                    traceback.print_exc()
+                    self.log_traceback("copy media")
                     
-                    if temp_path and os.path.exists(temp_path):
-                        try:
-                            os.remove(temp_path)
-                        except:
-                            pass
+                    if progress:
+                        progress.cancel()
                     
                     try:
                         await client.send_message(destination, text, file=message.media)
@@ -1776,6 +2114,17 @@ Created by @AkMovieVerse
                         print(f"[COPY] Direct reference failed: {ref_error}")
                         if text:
                             await client.send_message(destination, text)
+                
+                finally:
+                    # Every exit gives up the cache hold, or removes our own partial download
+                    if cache_held:
+                        self.media_cache.release(cache_key)
+                    else:
+                        # A partial download can be large; unlink it off the event loop
+                        try:
+                            await asyncio.to_thread(os.remove, temp_path)
+                        except OSError:
+                            pass
             
             elif text:
                 await client.send_message(destination, text)
@@ -1785,13 +2134,15 @@ Created by @AkMovieVerse
                 print(f"[COPY] Empty message, skipped")
         
         except Exception as e:
+            # Re-raised; the queue processor logs it with its traceback
             print(f"[COPY] Critical error in _copy_message_with_media: {e}")
-            traceback.print_exc()
             raise    
     
     async def cmd_stats(self, event, user_id: int):
-        stats = await self.db.get_stats()
-        sessions = await self.db.user_sessions.count_documents({})
+        stats, sessions = await asyncio.gather(
+            self.db.get_stats(),
+            self.db.user_sessions.count_documents({})
+        )
         
         await event.reply(
             f"**Bot Statistics**\n\n"
@@ -1803,46 +2154,85 @@ Created by @AkMovieVerse
         )
     
     async def cmd_users(self, event, user_id: int):
-        users = await self.db.get_all_users()
+        total = await self.db.get_user_count()
+        users = await self.db.get_users_page(0, 20)
         
-        message = f"**All Users ({len(users)}):**\n\n"
-        for i, user in enumerate(users[:20], 1):
-            message += f"{i}. {user['username']} (`{user['user_id']}`)\n"
+        parts = [f"**All Users ({total}):**\n\n"]
+        parts.extend(f"{i}. {user['username']} (`{user['user_id']}`)\n" for i, user in enumerate(users, 1))
         
-        if len(users) > 20:
-            message += f"\n... +{len(users)-20} more"
+        if total > 20:
+            parts.append(f"\n... +{total-20} more")
         
-        await event.reply(message)
+        await event.reply("".join(parts))
     
     async def cmd_broadcast(self, event, user_id: int):
-        self.awaiting_broadcast[user_id] = True
+        self.user_state[user_id] = State.AWAIT_BROADCAST
         await event.reply("Send your broadcast message:")
     
     async def handle_broadcast(self, event):
-        users = await self.db.get_all_users()
-        self.awaiting_broadcast[event.sender_id] = False
+        self.user_state.pop(event.sender_id, None)
         
-        status = await event.reply(f"Broadcasting to {len(users)} users...")
+        status = await event.reply(f"Broadcasting to {await self.db.get_user_count()} users...")
         
+        # Bounds both in-flight sends and the number of live tasks, since
+        # user IDs are streamed from MongoDB instead of loaded up front
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        pending = set()
+        total = 0
         success = 0
-        for user in users:
+        failures = Counter()  # error type -> users it stopped
+        
+        async def send_one(user_id):
+            nonlocal success
             try:
-                await self.bot_client.send_message(int(user['user_id']), event.message)
-                success += 1
-                await asyncio.sleep(0.1)
-            except:
-                pass
-        
-        await status.edit(f"Broadcast complete! Sent to {success}/{len(users)} users")
-        
-        await self.log_to_channel(
-            f"**Broadcast Sent**\n\n"
-            f"Sent by: {event.sender.username or event.sender.first_name}\n"
-            f"Admin ID: `{event.sender_id}`\n"
-            f"Success: {success}/{len(users)} users\n"
-            f"Message Preview: {event.message.text[:100] if event.message.text else 'Media message'}...",
-            "admin"
+                # Flood waits are retried for as long as Telegram asks; any
+                # other error is permanent for this user
+                while True:
+                    await self.broadcast_limiter.acquire()
+                    try:
+                        await self.bot_client.send_message(user_id, event.message)
+                        success += 1
+                        return
+                    except FloodWaitError as e:
+                        print(f"Broadcast flood wait: sleeping {e.seconds}s")
+                        await asyncio.sleep(e.seconds)
+                    except Exception as e:
+                        failures[type(e).__name__] += 1
+                        logger.debug("Broadcast to %s failed: %s", user_id, e)
+                        return
+            finally:
+                semaphore.release()
+        
+        async for user_id in self.db.iter_user_ids():
+            await semaphore.acquire()
+            total += 1
+            task = asyncio.create_task(send_one(user_id))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        
+        if pending:
+            await asyncio.gather(*pending)
+        
+        failed = sum(failures.values())
+        failure_summary = ", ".join(f"{name}: {count}" for name, count in failures.most_common())
+        if failed:
+            print(f"Broadcast failed for {failed} user(s): {failure_summary}")
+        
+        await status.edit(
+            f"Broadcast complete! Sent to {success}/{total} users"
+            + (f"\nFailed: {failed} ({failure_summary})" if failed else "")
         )
+        
+        if self.logging_enabled:
+            self.log_to_channel(
+                f"**Broadcast Sent**\n\n"
+                f"Sent by: {event.sender.username or event.sender.first_name}\n"
+                f"Admin ID: `{event.sender_id}`\n"
+                f"Success: {success}/{total} users\n"
+                f"Failed: {failed}\n"
+                f"Message Preview: {event.message.text[:100] if event.message.text else 'Media message'}...",
+                "admin"
+            )
     
     async def cmd_ban(self, event, user_id: int, args):
         if not args:
@@ -1862,12 +2252,18 @@ Created by @AkMovieVerse
                 await event.reply("**Cannot ban the bot owner!**")
                 return
             
-            if await self.db.is_user_banned(ban_user_id):
+            if self.is_banned(ban_user_id):
                 await event.reply(f"**User `{ban_user_id}` is already banned!**")
                 return
             
-            reason = " ".join(args[1:]) if len(args) > 1 else "No reason provided"
-            await self.db.ban_user(ban_user_id, reason)
+            reason = " ".join(args[1:]) or "No reason provided"
+            user = await self.db.get_user(ban_user_id)
+            username = user.get('username', 'Unknown') if user else 'Unknown'
+            
+            if not await self.db.ban_user(ban_user_id, username, reason):
+                await event.reply("**Failed to ban user!** Database error occurred.")
+                return
+            self.banned_ids.add(ban_user_id)
             await event.reply(f"**User `{ban_user_id}` has been banned!**\n**Reason:** {reason}")
             
         except ValueError:
@@ -1887,7 +2283,7 @@ Created by @AkMovieVerse
         try:
             unban_user_id = int(args[0])
             
-            if not await self.db.is_user_banned(unban_user_id):
+            if not self.is_banned(unban_user_id):
                 await event.reply(f"**User `{unban_user_id}` is not banned!**")
                 return
             
@@ -1895,6 +2291,7 @@ Created by @AkMovieVerse
             username = ban_info.get('username', f"User {unban_user_id}") if ban_info else f"User {unban_user_id}"
             
             if await self.db.unban_user(unban_user_id):
+                self.banned_ids.discard(unban_user_id)
                 await event.reply(
                     f"**User Unbanned Successfully!**\n\n"
                     f"**User:** {username}\n"
@@ -1905,33 +2302,43 @@ Created by @AkMovieVerse
                     f"• Access all bot features\n\n"
                     f"Use `/ban {unban_user_id} [reason]` to ban again if needed"
                 )
+                self.spawn(self.notify_unbanned(unban_user_id))
                 
-                try:
-                    await self.bot_client.send_message(
-                        unban_user_id,
-                        f"**You have been unbanned!**\n\n"
-                        f"You can now use the bot again.\n\n"
-                        f"Use /start to begin using bot features."
+                if self.logging_enabled:
+                    self.log_to_channel(
+                        f"**User Unbanned**\n\n"
+                        f"**Unbanned User:** {username}\n"
+                        f"**User ID:** `{unban_user_id}`\n"
+                        f"**Unbanned by:** {event.sender.username or event.sender.first_name}\n"
+                        f"**Admin ID:** `{user_id}`",
+                        "admin"
                     )
-                except Exception as notify_err:
-                    print(f"Could not notify unbanned user: {notify_err}")
-                
-                await self.log_to_channel(
-                    f"**User Unbanned**\n\n"
-                    f"**Unbanned User:** {username}\n"
-                    f"**User ID:** `{unban_user_id}`\n"
-                    f"**Unbanned by:** {event.sender.username or event.sender.first_name}\n"
-                    f"**Admin ID:** `{user_id}`",
-                    "admin"
-                )
             else:
                 await event.reply("**Failed to unban user!** Database error occurred.")
         except ValueError:
             await event.reply("**Invalid user ID!** Please provide a numeric user ID.")
         except Exception as e:
             await event.reply(f"**Error:** {e}")
-            import traceback
-            traceback.print_exc()
+            self.log_traceback("cmd_unban")
+    
+    async def notify_unbanned(self, user_id: int):
+        try:
+            await self.bot_client.send_message(
+                user_id,
+                f"**You have been unbanned!**\n\n"
+                f"You can now use the bot again.\n\n"
+                f"Use /start to begin using bot features."
+            )
+        except Exception as notify_err:
+            print(f"Could not notify unbanned user: {notify_err}")
+    
+    async def cmd_stop(self, event, user_id: int):
+        await event.reply(
+            "**Stopping bot...**\n\n"
+            "Run `python main.py start` to restart."
+        )
+        print("\nBot stopped by command")
+        self.shutdown_event.set()
     
     async def cmd_banned(self, event, user_id: int):
         banned = await self.db.get_banned_users()
@@ -1944,7 +2351,8 @@ Created by @AkMovieVerse
             )
             return
         
-        message = f"**Banned Users ({len(banned)}):**\n\n"
+        parts = [f"**Banned Users ({len(banned)}):**\n\n"]
+        length = len(parts[0])
         
         for i, user in enumerate(banned, 1):
             username = user.get('username', 'Unknown')
@@ -1954,77 +2362,135 @@ Created by @AkMovieVerse
             
             if ban_date:
                 try:
-                    ban_date_str = ban_date.strftime('%Y-%m-%d')
+                    ban_date_str = f"{ban_date:%Y-%m-%d}"
                 except:
                     ban_date_str = 'Unknown'
             else:
                 ban_date_str = 'Unknown'
             
-            message += f"**{i}.** {username}\n"
-            message += f"   ID: `{user_id_str}`\n"
-            message += f"   Reason: {reason}\n"
-            message += f"   Banned: {ban_date_str}\n\n"
+            entry = (
+                f"**{i}.** {username}\n"
+                f"   ID: `{user_id_str}`\n"
+                f"   Reason: {reason}\n"
+                f"   Banned: {ban_date_str}\n\n"
+            )
+            parts.append(entry)
+            length += len(entry)
             
-            if len(message) > 3500:
-                message += f"\n... and {len(banned) - i} more users\n\n"
-                message += "Note: Message truncated due to length"
+            if length > 3500:
+                parts.append(f"\n... and {len(banned) - i} more users\n\n")
+                parts.append("Note: Message truncated due to length")
                 break
         
-        message += f"\nUse `/unban <user_id>` to unban\n"
-        message += f"Use `/ban <user_id> [reason]` to ban more users"
+        parts.append(
+            "\nUse `/unban <user_id>` to unban\n"
+            "Use `/ban <user_id> [reason]` to ban more users"
+        )
         
-        await event.reply(message)
+        await event.reply("".join(parts))
     
     async def handle_callback(self, event):
         data = event.data.decode('utf-8')
         user_id = event.sender_id
         
-        if data == "login":
-            await event.answer("Starting login...")
-            await self.cmd_login(event, user_id)
-        elif data == "help":
-            await self.cmd_help(event, user_id)
-        elif data == "myaccount":
-            await self.cmd_myaccount(event, user_id)
-        elif data == "mychannels":
-            await self.cmd_list(event, user_id)
-        elif data == "mystatus":
-            await self.cmd_status(event, user_id)
-        elif data == "addsource":
-            await self.cmd_addsource(event, user_id)
-        elif data == "setdest":
-            await self.cmd_setdest(event, user_id)
-        elif data == "admin" and user_id == self.owner_id:
-            await event.answer("Admin panel")
-            await event.edit(
-                "**Admin Panel**\n\n"
-                "Use admin commands to manage the bot",
-                buttons=[[Button.inline("Back", b"start")]]
-            )
-        elif data == "start":
-            await self.cmd_start(event, user_id)
+        if not self.button_cooldown.allow(user_id):
+            await event.answer("Slow down")
+            return
+        
+        handler = self.callbacks.get(data)
+        if handler:
+            await handler(event, user_id)
     
-    async def run(self):
-        if not await self.initialize():
+    async def cb_login(self, event, user_id: int):
+        await event.answer("Starting login...")
+        await self.cmd_login(event, user_id)
+    
+    async def cb_admin(self, event, user_id: int):
+        if user_id != self.owner_id:
             return
+        await event.answer("Admin panel")
+        await event.edit(
+            "**Admin Panel**\n\n"
+            "Use admin commands to manage the bot",
+            buttons=_BACK_BUTTONS
+        )
+    
+    async def run(self):
+        log_listener = setup_logging()
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS)
+        )
         
         try:
-            await self.bot_client.run_until_disconnected()
-        
-        except KeyboardInterrupt:
-            print("\n\nStopping bot...")
-            for client in self.user_clients.values():
-                try:
-                    await client.disconnect()
-                except:
-                    pass
-            for client in self.temp_clients.values():
-                try:
-                    await client.disconnect()
-                except:
-                    pass
-            print("Thanks for using Auto Forward Bot!")
-            print("Hub: @instawallpaper\n")
+            if not await self.initialize():
+                return
+            
+            # Runs until the bot client drops or /stop sets shutdown_event
+            stopping = asyncio.create_task(self.shutdown_event.wait())
+            try:
+                await asyncio.wait(
+                    (self.bot_client.disconnected, stopping),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+            
+            except KeyboardInterrupt:
+                print("\n\nStopping bot...")
+                print("Thanks for using Auto Forward Bot!")
+                print("Hub: @instawallpaper\n")
+            
+            finally:
+                stopping.cancel()
+                await self.shutdown()
+        finally:
+            log_listener.stop()
+    
+    async def shutdown(self):
+        for source in self.source_queues.values():
+            if source.processor:
+                source.processor.cancel()
+        self.source_queues.clear()
+        
+        if self.stats_flush_task:
+            self.stats_flush_task.cancel()
+            self.stats_flush_task = None
+        if self.login_reaper_task:
+            self.login_reaper_task.cancel()
+            self.login_reaper_task = None
+        
+        # Let in-flight background work finish briefly before disconnecting
+        if self.background_tasks:
+            _, pending = await asyncio.wait(self.background_tasks, timeout=5)
+            for task in pending:
+                task.cancel()
+        if self.db.client:
+            await self._flush_forwards()
+        
+        if self.milestone_task:
+            self.milestone_task.cancel()
+            self.milestone_task = None
+        
+        if self.log_flush_task:
+            self.log_flush_task.cancel()
+            self.log_flush_task = None
+            pending_logs = []
+            while not self.log_queue.empty():
+                pending_logs.append(self.log_queue.get_nowait())
+            if pending_logs and self.bot_client.is_connected():
+                await self._send_logs(pending_logs)
+        
+        pending_clients = [login.client for login in self.pending_logins.values() if login.client]
+        for client in list(self.user_clients.values()) + pending_clients:
+            with suppress(Exception):
+                await client.disconnect()
+        self.user_clients.clear()
+        self.user_handlers.clear()
+        self.pending_logins.clear()
+        self.media_cache.clear()
+        
+        if self.bot_client and self.bot_client.is_connected():
+            await self.bot_client.disconnect()
+        
+        self.db.close()
 
 
 def print_help():
@@ -2035,7 +2501,7 @@ def print_help():
     print("Join: @instawallpaper\n")
     print("Usage: python main.py [command]\n")
     print("Commands:")
-    print("  setup    - Configure the bot")
+    print("  setup    - Configure the bot (setup --help for non-interactive options)")
     print("  start    - Start the bot")
     print("  help     - Show this help")
     print("\n" + "="*60 + "\n")
@@ -2050,7 +2516,7 @@ async def main():
     bot = ForwardBot()
     
     if command == 'setup':
-        await bot.setup_bot()
+        bot.setup_bot(sys.argv[2:])
     elif command == 'start':
         await bot.run()
     elif command == 'help':
@@ -2061,6 +2527,8 @@ async def main():
 
 
 if __name__ == '__main__':
+    if uvloop:
+        uvloop.install()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
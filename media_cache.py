@@ -0,0 +1,89 @@
+# media_cache.py
+"""
+Media Cache for Telegram Forward Bot
+Shares a downloaded file between copies of the same source message that
+overlap, so it is only downloaded once even when several users forward it
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+
+class MediaCache:
+    """Downloaded file paths keyed by (chat_id, message_id), deleted once unused"""
+    
+    def __init__(self):
+        self._entries = {}  # key -> [path, refs]
+        self._locks = {}  # key -> [lock, users waiting on or holding it]
+    
+    @asynccontextmanager
+    async def lock(self, key):
+        """Serialize downloads of the same message"""
+        slot = self._locks.get(key)
+        if slot is None:
+            slot = self._locks[key] = [asyncio.Lock(), 0]
+        
+        # Counted before acquiring, so a lock with queued waiters is never dropped
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._locks[key]
+                self._prune(key)
+    
+    async def get(self, key):
+        """Return a cached path and hold it until release(), or None"""
+        entry = self._entries.get(key)
+        if entry is None or not await asyncio.to_thread(os.path.exists, entry[0]):
+            return None
+        
+        entry[1] += 1
+        return entry[0]
+    
+    def put(self, key, path: str):
+        """Cache a freshly downloaded file, held by the caller"""
+        old = self._entries.get(key)
+        if old is not None and old[0] != path:
+            self._remove(old[0])
+        self._entries[key] = [path, (old[1] if old else 0) + 1]
+    
+    def release(self, key):
+        """Give up a hold taken by get() or put()"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > 0:
+            entry[1] -= 1
+        self._prune(key)
+    
+    def clear(self):
+        """Delete every cached file"""
+        for path, _ in self._entries.values():
+            self._remove(path)
+        self._entries.clear()
+    
+    def _prune(self, key):
+        # Nobody holds the file and nobody is waiting to reuse it
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] == 0 and key not in self._locks:
+            del self._entries[key]
+            self._remove(entry[0])
+    
+    @staticmethod
+    def _remove(path: str):
+        # Files can be several GB; unlink them on the default executor
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _unlink(path)
+        else:
+            loop.run_in_executor(None, _unlink, path)
+
+
+def _unlink(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
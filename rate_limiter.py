@@ -0,0 +1,139 @@
+# rate_limiter.py
+"""
+Rate Limiter for Telegram Forward Bot
+Sliding-window token bucket used to stay under Telegram's flood limits
+"""
+
+import asyncio
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """Allow at most `rate` acquisitions per `period` seconds"""
+    
+    def __init__(self, rate: int = 30, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self._sent = deque()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a send slot is free in the current window"""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                while self._sent and now - self._sent[0] >= self.period:
+                    self._sent.popleft()
+                
+                if len(self._sent) < self.rate:
+                    self._sent.append(now)
+                    return
+                
+                await asyncio.sleep(self.period - (now - self._sent[0]))
+
+
+class Cooldown:
+    """Per-key minimum interval between actions, e.g. button presses"""
+    
+    def __init__(self, interval: float = 0.5, max_keys: int = 10000):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._last = {}
+    
+    def allow(self, key) -> bool:
+        """Record an action for `key`, returning False if it came too soon"""
+        now = time.monotonic()
+        if now - self._last.get(key, float('-inf')) < self.interval:
+            return False
+        
+        if len(self._last) >= self.max_keys:
+            # Forget keys that have been idle for a while
+            cutoff = now - max(60, self.interval)
+            self._last = {k: t for k, t in self._last.items() if t > cutoff}
+        
+        self._last[key] = now
+        return True
+
+
+class AdaptiveLimiter:
+    """Concurrency cap that halves on FloodWait and slowly grows back"""
+    
+    def __init__(self, limit: int = 20, recover_every: float = 30.0):
+        self.max_limit = limit
+        self.limit = limit
+        self.recover_every = recover_every
+        self._active = 0
+        self._since = time.monotonic()
+        self._cond = asyncio.Condition()
+    
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(self._has_slot)
+            self._active += 1
+    
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+    
+    def backoff(self):
+        """Telegram pushed back, halve the number of concurrent calls"""
+        self.limit = max(1, self.limit // 2)
+        self._since = time.monotonic()
+    
+    def _has_slot(self) -> bool:
+        # Regain one slot per quiet `recover_every` seconds
+        now = time.monotonic()
+        if self.limit >= self.max_limit:
+            self._since = now
+        else:
+            steps = int((now - self._since) // self.recover_every)
+            if steps:
+                self.limit = min(self.max_limit, self.limit + steps)
+                self._since += steps * self.recover_every
+        
+        return self._active < self.limit
+
+
+class EditThrottler:
+    """Coalesce edits of one message, sending at most one per `interval` seconds"""
+    
+    def __init__(self, message, interval: float = 2.0):
+        self.message = message
+        self.interval = interval
+        self._latest = None
+        self._last_edit = float('-inf')
+        self._task = None
+    
+    def update(self, text: str):
+        """Make `text` the next edit without waiting for it to be sent"""
+        self._latest = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+    
+    def cancel(self):
+        """Drop pending edits, e.g. before a final edit or delete"""
+        self._latest = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _flush(self):
+        # Keep going while updates arrive during an edit; only the newest is sent
+        while self._latest is not None:
+            delay = self._last_edit + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            text, self._latest = self._latest, None
+            if text is None:
+                return
+            
+            self._last_edit = time.monotonic()
+            try:
+                await self.message.edit(text)
+            except Exception:
+                # Progress is best effort; a failed edit is replaced by the next one
+                pass
@@ -0,0 +1,54 @@
+# state.py
+"""
+Conversation states for Telegram Forward Bot
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Optional
+
+from telethon import TelegramClient
+
+
+class State(IntEnum):
+    """What the bot expects as the user's next message"""
+    AWAIT_SOURCE = 1
+    AWAIT_DEST = 2
+    AWAIT_BROADCAST = 3
+    AWAIT_PHONE = 4
+    AWAIT_CODE = 5
+    AWAIT_PASSWORD = 6
+
+
+@dataclass(slots=True)
+class PendingLogin:
+    """A login that is waiting for its code or 2FA password"""
+    phone: str
+    phone_code_hash: str = ''
+    client: Optional[TelegramClient] = None
+    started: float = field(default_factory=time.monotonic)
+
+
+@dataclass(slots=True)
+class SourceQueue:
+    """Ordered backlog of one user's source channel and the task draining it"""
+    queue: asyncio.Queue
+    stop_event: asyncio.Event = field(default_factory=asyncio.Event)
+    processor: Optional[asyncio.Task] = None
+    busy: bool = False  # a message is being forwarded right now
+    running: bool = False  # cleared by the processor task's done callback
+    full_count: int = 0  # times a producer had to wait for room
+    full_logged_at: float = float('-inf')
+    
+    def start(self, coro) -> asyncio.Task:
+        """Run `coro` as this queue's processor"""
+        self.running = True
+        self.processor = asyncio.create_task(coro)
+        self.processor.add_done_callback(self._stopped)
+        return self.processor
+    
+    def _stopped(self, task: asyncio.Task):
+        if task is self.processor:
+            self.running = False